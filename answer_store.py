@@ -0,0 +1,25 @@
+import itertools
+
+
+class AnswerStore:
+    """The answers of one round, keyed by user.
+
+    Answering again replaces the previous answer and moves the user to the back, like a fresh answer, in O(1).
+    Dict order is arrival order, and every answer keeps its arrival sequence number.
+    """
+
+    def __init__(self):
+        self.answers = {}
+        self.seq = itertools.count()
+
+    def add(self, user, option):
+        self.answers.pop(user, None)
+        self.answers[user] = (next(self.seq), option)
+
+    def score(self, correct_option, points_per_rank=10):
+        "[(user, points)] for the users who answered `correct_option`, fastest first. The last one gets `points_per_rank`."
+        winners = [user for user, (_, option) in self.answers.items() if option == correct_option]
+        return [(user, (len(winners) - rank) * points_per_rank) for rank, user in enumerate(winners)]
+
+    def __len__(self):
+        return len(self.answers)
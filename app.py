@@ -2,20 +2,32 @@ from fasthtml.common import *
 from fasthtml.xtend import picolink
 from fasthtml.oauth import GoogleAppClient
 import asyncio
-from collections import deque
-from dataclasses import dataclass, field
-import concurrent.futures
+import itertools
+from dataclasses import dataclass, field, asdict
 import logging
-import threading
+import time
+import math
 from typing import List, Tuple
 from auth import HuggingFaceClient
 from difflib import SequenceMatcher
-from js_scripts import ThemeSwitch, enterToBid
+from js_scripts import ThemeSwitch, enterToBid, countdownTicker
 import llm_req
+import broadcast
+import metrics
+import game_backend
+from topic_board import TopicBoard
+from topic_store import TopicStore
+from points_ledger import PointsLedger
+from async_db import AsyncDB
+from question_deck import QuestionDeck
+from trivia_import import import_trivias
+from leaderboard import Leaderboard
+from page_cache import PageCache
+from answer_store import AnswerStore
+from connections import ConnectionRegistry, UNASSIGNED
 import copy
+import os
 import env_vars
-import sqlite3
-from datasets import load_dataset
 
 VERSION = "2.8.6"
 
@@ -26,7 +38,9 @@ SIGN_IN_TEXT = """Only logged users can play. Press on either "Sign in with Hugg
 db_path = f'{env_vars.DB_DIRECTORY}/trivia.db'
 db = database(db_path)
 players = db.t.players
-trivias = db.t.trivias
+# Everything at runtime goes through adb, which runs the statements on its own thread; db is only used to create the tables.
+adb = None
+page_cache = PageCache(env_vars.PAGE_CACHE_SIZE)
     
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
@@ -83,10 +97,12 @@ class Topic:
     topic: str = field(compare=False)
     status: str = field(default="pending", compare=False)
     user: str = field(default="[bot]", compare=False)
-    answers: List[Tuple[str, str]] = field(default_factory=list, compare=False)
-    winners: List[str] = field(default_factory=list, compare=False)
+    answers: AnswerStore = field(default_factory=AnswerStore, compare=False)
+    winners: List[Tuple[str, int]] = field(default_factory=list, compare=False)  # (user, points won), fastest first
     question: Question = field(default=None, compare=False)
     is_from_db: bool = field(default=False, compare=False)
+    created: float = field(default_factory=time.monotonic, compare=False)
+    round_id: int = field(default=None, compare=False)  # set when the topic is shown
     def __hash__(self):
         return hash((self.points, self.topic, self.user))
 
@@ -96,105 +112,282 @@ class Topic:
         return False
 
 
+def question_from_llm(content):
+    return Question(content["trivia question"],
+                    content["option A"],
+                    content["option B"],
+                    content["option C"],
+                    content["option D"],
+                    content["correct answer"].replace(" ", "_"))
+
+
 class TaskManager:
-    def __init__(self, num_executors: int):
-        self.topics = deque()
+    def __init__(self, num_executors: int, backend, ledger, deck):
+        self.topics = TopicStore()
         self.topics_lock = asyncio.Lock()
         self.answers_lock = asyncio.Lock()
         self.past_topic = None
-        self.executors = [concurrent.futures.ThreadPoolExecutor(max_workers=1) for _ in range(num_executors)]
-        self.executor_tasks = [set() for _ in range(num_executors)]
+        # Topics that need moderation or generation are queued here by whoever changes them; idle workers wait on it.
+        # Highest bid first, like the order of self.topics.
+        self.work_queue = asyncio.PriorityQueue()
+        self.work_seq = itertools.count()
+        self.in_flight = set()
+        self.llm_latency = {"topic_check": None, "generate_question": None}
+        self.topics_changed = asyncio.Event()
         self.current_topic_start_time = None
         self.current_timeout_task = None
-        self.online_users = {"unassigned_clients": {'ws_clients': set(), 'combo_count': 0 }}  # Track connected WebSocket clients
-        self.online_users_lock = threading.Lock()
-        self.task = None
-        self.countdown_var = env_vars.QUESTION_COUNTDOWN_SEC
+        self.online_users = ConnectionRegistry()  # Track connected WebSocket clients
+        self.current_deadline = None
         self.current_topic = None
-        self.all_users = {}
+        self.topic_board = TopicBoard(lambda: self.topics.top(env_vars.NR_TOPICS_TO_BROADCAST), env_vars.NR_TOPICS_TO_BROADCAST, env_vars.TOPIC_BOARD_COALESCE_MS / 1000, self.publish_board)
+        self.num_executors = num_executors
+        self.round_id = 0
+        # Only the leader runs rounds and executors; every worker mirrors what it needs in `shared`.
+        self.backend = backend
+        self.ledger = ledger
+        self.deck = deck
+        self.shared = {}
+        self.current_question = None
+        self.option_fragments = {}
+        self.current_question_html = None
+        self.leader_tasks = []
+        backend.subscribe(self.on_backend_message)
+        backend.on_leadership(self.on_leadership)
+
+    async def start(self):
+        await self.backend.start()
+        for key, value in (await self.backend.all_state()).items():
+            self.apply_state(key, value)
+        asyncio.create_task(self.heartbeat())
+
+    async def on_leadership(self, is_leader):
+        for task in self.leader_tasks:
+            task.cancel()
+        self.leader_tasks = []
+        if self.current_timeout_task:
+            self.current_timeout_task.cancel()
+        interrupted = self.current_topic
+        # a round that was already scored must not be scored again by the next consume_successful_topic
+        self.past_topic = None
+        async with self.topics_lock:
+            # the shared `user_topics` state is the truth; whatever this worker still holds may be stale or already in it
+            self.topics = TopicStore()
+            self.in_flight.clear()
+            self.work_queue = asyncio.PriorityQueue()
+        if not is_leader:
+            return
+        async with self.topics_lock:
+            for t in await self.backend.get_state("user_topics", []):
+                question = Question(**t["question"]) if t["question"] else None
+                self.topics.add(Topic(points=t["points"], topic=t["topic"], user=t["user"], status=t["status"], question=question))
+            for topic in self.topics:
+                self.enqueue(topic)
+        # continue the round ids of whoever led before, so scoring can tell rounds apart
+        self.round_id = max(self.round_id, self.shared.get("round", {}).get("id", 0))
+        if interrupted is not None and interrupted.round_id == self.round_id:
+            # nobody started a round since this worker's: its answers are here, score it when the next one starts
+            self.past_topic = interrupted
+        self.current_topic = None
+        self.topics_changed.set()
+        self.leader_tasks.append(asyncio.create_task(self.monitor_topics()))
+        for i in range(self.num_executors):
+            self.leader_tasks.append(asyncio.create_task(self.run_executor(i)))
+
+    async def on_backend_message(self, channel, message):
+        if channel == "broadcast":
+            broadcast.publish(self.online_users.connections(message.get("user")), message["html"], message["key"])
+        elif channel == "state" and message["worker"] != self.backend.worker_id:
+            self.apply_state(message["key"], message["value"])
+        elif channel == "command" and self.backend.is_leader:
+            if message["type"] == "answer":
+                await self.add_answer(message["user"], message["option"], message["round"])
+            elif message["type"] == "bid":
+                await self.add_user_topic(points=message["points"], topic=message["topic"], user_id=message["user"])
+
+    def apply_state(self, key, value):
+        self.shared[key] = value
+        if key == "round":
+            self.current_question = Question(**value["question"])
+            # rendered once per round; every click and every (re)connect gets these strings
+            self.option_fragments = option_fragments(self.current_question)
+            self.current_question_html = broadcast.render(current_question_element(value, self.current_question, self.option_fragments[None]))
+
+    async def share_state(self, key, value):
+        self.apply_state(key, value)
+        await self.backend.set_state(key, value)
+        await self.backend.publish("state", {"key": key, "value": value, "worker": self.backend.worker_id})
+
+    async def heartbeat(self):
+        while True:
+            await self.share_state(f"online_users:{self.backend.worker_id}", {"users": self.online_users.users(), "at": time.time()})
+            await asyncio.sleep(env_vars.HEARTBEAT_SEC)
+
+    def all_online_users(self):
+        users = set(self.online_users.users())
+        for key, value in self.shared.items():
+            if key.startswith("online_users:") and key != f"online_users:{self.backend.worker_id}" and value["at"] > time.time() - 3 * env_vars.HEARTBEAT_SEC:
+                users.update(value["users"])
+        return sorted(users)
+
+    def topic_names(self):
+        return self.shared.get("topic_names", [])
+
+    async def submit_answer(self, user_id, option):
+        round_id = self.shared["round"]["id"]
+        if self.backend.is_leader:
+            await self.add_answer(user_id, option, round_id)
+        else:
+            await self.backend.publish("command", {"type": "answer", "user": user_id, "option": option, "round": round_id})
 
-    def reset(self):
-        self.countdown_var = env_vars.QUESTION_COUNTDOWN_SEC
+    async def submit_bid(self, points, topic, user_id):
+        if self.backend.is_leader:
+            await self.add_user_topic(points=points, topic=topic, user_id=user_id)
+        else:
+            await self.backend.publish("command", {"type": "bid", "user": user_id, "topic": topic, "points": points})
+
+    async def add_answer(self, user_id, option, round_id):
+        async with self.answers_lock:
+            if self.current_topic is None or round_id != self.round_id:
+                return
+            self.current_topic.answers.add(user_id, option)
+
+    def enqueue(self, topic: Topic):
+        if topic.status not in ["successful", "failed"]:
+            self.work_queue.put_nowait((-topic.points, next(self.work_seq), topic))
 
     async def run_executor(self, executor_id: int):
         while True:
-            topic_to_process = None
-            async with self.topics_lock:
-                for topic in self.topics:
-                    if all(topic not in tasks for tasks in self.executor_tasks):
-                        if topic.status not in ["successful", "failed"]:
-                            self.executor_tasks[executor_id].add(topic)
-                            topic_to_process = topic
-                            break
-
-            if topic_to_process:
-                await self.update_status(topic_to_process)
-                async with self.topics_lock:
-                    self.executor_tasks[executor_id].remove(topic_to_process)
-            await asyncio.sleep(0.1)
+            _, _, topic = await self.work_queue.get()
+            await self.process(topic)
+
+    async def process(self, topic: Topic):
+        if topic not in self.topics or topic.status in ["successful", "failed"] or id(topic) in self.in_flight:
+            return
+        self.in_flight.add(id(topic))
+        try:
+            await self.update_status(topic)
+        finally:
+            self.in_flight.discard(id(topic))
+        self.enqueue(topic)
+
+    def record_latency(self, stage, seconds):
+        previous = self.llm_latency.get(stage)
+        self.llm_latency[stage] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+        metrics.set_gauge(f"{stage}_latency_sec", round(self.llm_latency[stage], 3))
+
+    def ready_target(self):
+        "How many successful topics to keep ready so a round never waits on the LLM."
+        pipeline_sec = 1 + sum(latency for latency in self.llm_latency.values() if latency)
+        target = math.ceil(pipeline_sec / env_vars.QUESTION_COUNTDOWN_SEC) + 1
+        return max(env_vars.READY_TOPICS_MIN, min(target, env_vars.READY_TOPICS_MAX))
+
+    def lookahead(self):
+        "Start generation right away for the best bids that passed moderation, as many as the buffer is short of."
+        missing = self.ready_target() - self.topics.count("successful")
+        for topic in self.topics.with_status("computing")[:max(missing, 0)]:
+            if id(topic) not in self.in_flight:
+                asyncio.create_task(self.process(topic))
+
+    async def check_and_generate(self, topic: Topic):
+        "Speculative path: generate while the safety check runs and keep the question only if the check passes. Returns (status, Question)."
+        started = time.monotonic()
+        generation = asyncio.create_task(llm_req.generate_question(topic.topic))
+        try:
+            llm_resp = await llm_req.topic_check(topic.topic)
+            self.record_latency("topic_check", time.monotonic() - started)
+            if llm_resp != "No":
+                metrics.inc("speculative_generations_discarded")
+                return "failed", None
+            content = await generation
+            self.record_latency("generate_question", time.monotonic() - started)
+            if not content:
+                return "failed", None
+            # a malformed payload raises here and fails the topic too
+            return "successful", question_from_llm(content)
+        finally:
+            generation.cancel()
+
+    def moderate_pending(self):
+        "With batched moderation, check up to a batch of pending user topics at once instead of a few at a time through the executors."
+        if env_vars.MODERATION_BATCH_SIZE <= 1:
+            return
+        pending = [topic for topic in self.topics.with_status("pending") if not topic.is_from_db]
+        # one batch in flight at a time; the rest wait for the next pass, which a finished check triggers
+        room = env_vars.MODERATION_BATCH_SIZE - sum(id(topic) in self.in_flight for topic in pending)
+        for topic in [topic for topic in pending if id(topic) not in self.in_flight][:max(room, 0)]:
+            asyncio.create_task(self.process(topic))
 
     async def update_status(self, topic: Topic):
-        await asyncio.sleep(1)
+        if not (env_vars.SPECULATIVE_GENERATION and topic.status == "pending"):
+            await asyncio.sleep(1)
         should_consume = False 
         if topic.is_from_db:
             async with self.topics_lock:
-                topic.status ="successful"
+                self.topics.set_status(topic, "successful")
         else:
             async with self.topics_lock:
                 clone_topic = copy.copy(topic)
             try:
-                if clone_topic.status == "pending":
+                started = time.monotonic()
+                if clone_topic.status == "pending" and env_vars.SPECULATIVE_GENERATION and not clone_topic.is_from_db:
+                    status, question = await self.check_and_generate(clone_topic)
+                    async with self.topics_lock:
+                        topic.question = question
+                        self.topics.set_status(topic, status)
+                elif clone_topic.status == "pending":
                     llm_resp = await llm_req.topic_check(clone_topic.topic)
+                    self.record_latency("topic_check", time.monotonic() - started)
                     if llm_resp == "No":
                         status = "computing"
                     else:
                         status = "failed"
                     async with self.topics_lock:
-                        topic.status = status
+                        self.topics.set_status(topic, status)
                 elif clone_topic.status == "computing":
                     content = await llm_req.generate_question(clone_topic.topic)
+                    self.record_latency("generate_question", time.monotonic() - started)
                     async with self.topics_lock:
-                        topic.question = Question(content["trivia question"],
-                                    content["option A"],
-                                    content["option B"],
-                                    content["option C"],
-                                    content["option D"],
-                                    content["correct answer"].replace(" ", "_"))
-                        topic.status = "successful"
+                        topic.question = question_from_llm(content)
+                        self.topics.set_status(topic, "successful")
             except Exception as e:
                 error_message = str(e)
                 logging.debug("llm error: " + error_message)
                 async with self.topics_lock:
-                    topic.status = "failed"
+                    self.topics.set_status(topic, "failed")
 
+        if topic.status == "successful" and not topic.is_from_db:
+            metrics.set_gauge("bid_to_ready_sec", round(time.monotonic() - topic.created, 3))
         await self.broadcast_next_topics()
         async with self.topics_lock:
             if topic.status == "successful" and self.current_topic is None:
                 should_consume = True
             if topic.status == "failed":
-                await asyncio.create_task(self.remove_failed_topic(topic))
+                asyncio.create_task(self.remove_failed_topic(topic))
         if should_consume:
-            if self.task:
-                self.task.cancel()
-            self.reset()
-            self.task = asyncio.create_task(self.count())
             await self.consume_successful_topic()
 
     async def consume_successful_topic(self):
         topic = None
         async with self.topics_lock:
-            successful_topics = [t for t in self.topics if t.status == "successful"]
-            if successful_topics:
-                topic = successful_topics[0]
+            topic = self.topics.pop_successful()
+            if topic is None:
+                # nothing ready: the next topic that becomes successful starts the round instead of the game stalling
+                self.current_topic = None
+            if topic:
                 logging.debug(f"Topic obtained: {topic.topic}")
-                self.topics.remove(topic)
                 self.current_topic = topic
                 self.current_topic_start_time = asyncio.get_event_loop().time()
+                self.current_deadline = time.time() + env_vars.QUESTION_COUNTDOWN_SEC
+                self.round_id += 1
+                topic.round_id = self.round_id
                 self.current_timeout_task = asyncio.create_task(self.topic_timeout())
                 
         if topic:
             logging.debug(f"We have a topic to broadcast: {topic.topic}")
+            await self.share_state("round", {"id": self.round_id, "question": asdict(topic.question), "user": topic.user,
+                                             "points": topic.points, "deadline": self.current_deadline})
             await self.broadcast_current_question()
+            await self.broadcast_countdown()
             await self.broadcast_next_topics()
             await self.compute_winners()
             await self.broadcast_past_topic()
@@ -221,10 +414,6 @@ class TaskManager:
                 logging.debug(f"Completing topic: {self.current_topic.topic}")
                 should_consume = True
         if should_consume:
-            if self.task:
-                self.task.cancel()
-                self.reset()
-            self.task = asyncio.create_task(self.count())
             self.past_topic = self.current_topic
             await self.consume_successful_topic()
 
@@ -237,106 +426,131 @@ class TaskManager:
 
     async def monitor_topics(self):
         while True:
+            await self.topics_changed.wait()
+            self.topics_changed.clear()
             need_default_topics = False
             async with self.topics_lock:
-                if all(topic.status in ["successful", "failed"] for topic in self.topics):
+                # DB questions need no work, so they top up the ready buffer straight away
+                for topic in self.topics.with_status("pending"):
+                    if self.topics.count("successful") >= self.ready_target():
+                        break
+                    if topic.is_from_db:
+                        self.topics.set_status(topic, "successful")
+                if not self.topics.any_pending() or self.topics.count("successful") < self.ready_target():
                     need_default_topics = True
+                start_round = self.current_topic is None and self.topics.count("successful") > 0
 
+            self.lookahead()
+            self.moderate_pending()
             if need_default_topics:
                 await self.add_database_topics()
-            await asyncio.sleep(1)  # Check periodically
+            if start_round:
+                await self.consume_successful_topic()
+            metrics.set_gauge("ready_topics", self.topics.count("successful"))
+            metrics.set_gauge("ready_topics_target", self.ready_target())
     
     async def add_database_topics(self):
         async with self.topics_lock:
             if len(self.topics) < env_vars.MAX_NR_TOPICS_FOR_ALLOW_MORE:
                 try:
-                    trivia_recs = db.q(f"SELECT * FROM {trivias} ORDER BY RANDOM() LIMIT {env_vars.MAX_NR_TOPICS_FOR_ALLOW_MORE}")                   
+                    trivia_recs = await self.deck.deal(env_vars.MAX_NR_TOPICS_FOR_ALLOW_MORE)
                     for trivia_rec in trivia_recs:
-                        self.topics.append(
-                            Topic(points=0,
-                                  topic=trivia_rec["topic"],
-                                  user="[bot]", 
-                                  question=Question(trivia_rec["question"], trivia_rec["option_A"],  trivia_rec["option_B"], trivia_rec["option_C"], trivia_rec["option_D"], "option_{}".format(trivia_rec["correct_option"])),
-                                  is_from_db=True))
-                    self.topics = deque(sorted(self.topics, reverse=True))
-                    await self.broadcast_next_topics()
-                    logging.debug("Default topics added")
+                        db_topic = Topic(points=0,
+                                         topic=trivia_rec["topic"],
+                                         user="[bot]", 
+                                         question=Question(trivia_rec["question"], trivia_rec["option_A"],  trivia_rec["option_B"], trivia_rec["option_C"], trivia_rec["option_D"], "option_{}".format(trivia_rec["correct_option"])),
+                                         is_from_db=True)
+                        self.topics.add(db_topic)
+                        self.enqueue(db_topic)
+                    # With no questions yet (the import is still running, or failed) there's nothing to show, and waking
+                    # monitor_topics would only bring it straight back here; the import wakes it when rows come in.
+                    if trivia_recs:
+                        await self.broadcast_next_topics()
+                        logging.debug("Default topics added")
                 except Exception as e:
                     error_message = str(e)
                     logging.debug("Issues when generating default topics: " + error_message)
 
     async def add_user_topic(self, points, topic, user_id):
         async with self.topics_lock:
-            self.topics.append(Topic(points=points, topic=topic, user=user_id))
-            self.topics = deque(sorted(self.topics, reverse=True))
+            new_topic = Topic(points=points, topic=topic, user=user_id)
+            self.topics.add(new_topic)
+            self.enqueue(new_topic)
             await self.broadcast_next_topics()
             logging.debug(f"User topic: {topic} added")
 
     async def broadcast_next_topics(self, client=None):
-        next_topics = list(self.topics)[:env_vars.NR_TOPICS_TO_BROADCAST]
-        status_dict = {
-            'failed': '#dc552c',
-            'pending': '#ede7dd',
-            'computing': '#cfb767',
-            'successful': '#77ab59'
-        }
-        next_topics_html = [Div(Div(f"{item.topic if item.status not in ['pending', 'failed'] else 'Topic Censored'}"),
-                                Div(item.user, cls="item left"), Div(f"{item.points} pts", cls="item right"),
-                                cls="card", style=f"background-color: {status_dict[item.status]}") for item in
-                            next_topics]
-        
-        await self.send_to_clients(Div(*next_topics_html, id="next_topics"), client)
+        if client is None:
+            # every change to the topic list ends up here, so this is also what wakes up monitor_topics
+            self.topics_changed.set()
+            self.topic_board.changed()
+        else:
+            await self.send_to_clients(self.shared.get("next_topics", self.topic_board.snapshot()), client)
+
+    async def publish_board(self, changed_cards):
+        # the snapshot goes out before the delta, so a client that connects in between misses nothing
+        await self.share_state("next_topics", self.topic_board.snapshot())
+        await self.send_to_clients(changed_cards)
+        names = [t.topic for t in self.topics] + [t.topic for t in (self.current_topic, self.past_topic) if t]
+        await self.share_state("topic_names", names)
+        await self.backend.set_state("user_topics", [{"points": t.points, "topic": t.topic, "user": t.user, "status": t.status,
+                                                      "question": asdict(t.question) if t.question else None}
+                                                     for t in self.topics if not t.is_from_db])
+
+    async def send_to_clients(self, element, client=None, key=None):
+        "`key` is the supersede key of an `element` that is already rendered."
+        if client is not None:
+            broadcast.publish([client], element, key)
+        else:
+            await self.backend.publish("broadcast", {"html": broadcast.render(element), "key": key or broadcast.supersede_key(element)})
+
+    async def send_to_user(self, user_id, element, key=None):
+        await self.backend.publish("broadcast", {"html": broadcast.render(element), "key": key or broadcast.supersede_key(element), "user": user_id})
+
+    def queue_depths(self):
+        return [len(c.queue) for c in self.online_users.connections()]
+
+    def remove_client(self, client):
+        if self.online_users.remove(client) is not None:
+            logging.debug(f"Removed disconnected client: {client}")
 
-    async def send_to_clients(self, element, client=None):
-        with self.online_users_lock:
-            clients = (self.online_users if client is None else {'unknown': { 'ws_clients': [client]}}).copy()
-        for client in [item for subset in clients.values() for item in subset['ws_clients']]:
-            try:
-                await client(element)
-            except:
-                with self.online_users_lock:
-                    key_to_remove = None
-                    for key, clients_data in self.online_users.items():
-                        if client in clients_data['ws_clients']:
-                            clients_data['ws_clients'].remove(client)
-                            if len(clients_data['ws_clients']) == 0:
-                                key_to_remove = key
-                            logging.debug(f"Removed disconnected client: {client}")
-                            break
-                    if key_to_remove:
-                        self.online_users.pop(key_to_remove)
-                        
     async def compute_winners(self):
+        if self.past_topic and self.past_topic.round_id <= self.shared.get("scored_round", 0):
+            logging.debug(f"Round {self.past_topic.round_id} was scored already")
+            return
         if self.past_topic:
             async with self.answers_lock:
-                self.past_topic.winners = [a[0] for a in self.past_topic.answers if a[1] == self.past_topic.question.correct_answer]
-            
-            ids = ", ".join([str(self.all_users[w]) for w in self.past_topic.winners])
-            db_players = db.q(f"select * from {players} where {players.c.id} in ({ids})")
-            
-            for db_winner in db_players:
-                winner_name = db_winner['name']
-                db_winner['points'] += (len(self.past_topic.winners) - self.past_topic.winners.index(winner_name)) * 10
-                    
-                self.online_users[winner_name]['combo_count'] += 1
-                if self.online_users[winner_name]['combo_count'] == env_vars.COMBO_CONSECUTIVE_NR_FOR_WIN:
-                    self.online_users[winner_name]['combo_count'] = 0
-                    db_winner['points'] += env_vars.COMBO_WIN_POINTS
-                    
-                    msg = f"Congratulations! You have earned {env_vars.COMBO_WIN_POINTS} extra points for answering {env_vars.COMBO_CONSECUTIVE_NR_FOR_WIN} questions correctly in a row."
-                    elem = Div(Div(Div(msg, cls=f"toast toast-info"), cls="toast-container"), hx_swap_oob="afterbegin:body")
-                    for client in self.online_users[winner_name]['ws_clients']:
-                        await self.send_to_clients(elem, client) 
-                        
-                players.update(db_winner)
-                elem = Div(winner_name + ": " + str(db_winner['points']) + " pts", cls='login', id='login_points')
-                for client in self.online_users[winner_name]['ws_clients']:
-                    await self.send_to_clients(elem, client)   
-            
+                self.past_topic.winners = self.past_topic.answers.score(self.past_topic.question.correct_answer)
+
+            # one pass over the winners: rank points, combo bonus and the combo counts of the next round
+            combo_counts = {}
+            changes = []
+            combo_winners = []
+            for winner_name, points in self.past_topic.winners:
+                if await self.ledger.get(winner_name) is None:
+                    continue
+                combo_counts[winner_name] = self.ledger.combo_counts.get(winner_name, 0) + 1
+                if combo_counts[winner_name] == env_vars.COMBO_CONSECUTIVE_NR_FOR_WIN:
+                    combo_counts[winner_name] = 0
+                    points += env_vars.COMBO_WIN_POINTS
+                    combo_winners.append(winner_name)
+                changes.append((winner_name, points))
+
+            # one journal write and one transaction for the whole round, however many winners
+            balances = await self.ledger.adjust(changes)
+            await self.share_state("scored_round", self.past_topic.round_id)
+            await self.ledger.flush()
+
+            msg = f"Congratulations! You have earned {env_vars.COMBO_WIN_POINTS} extra points for answering {env_vars.COMBO_CONSECUTIVE_NR_FOR_WIN} questions correctly in a row."
+            for winner_name in combo_winners:
+                elem = Div(Div(Div(msg, cls=f"toast toast-info"), cls="toast-container"), hx_swap_oob="afterbegin:body")
+                await self.send_to_user(winner_name, elem)
+            for (winner_name, _), balance in zip(changes, balances):
+                elem = Div(winner_name + ": " + str(balance) + " pts", cls='login', id='login_points')
+                await self.send_to_user(winner_name, elem)
+
             #if you won last question, but not this one, then sorry, it has to be consecutive, so resetting to 0
-            for key, user_data in self.online_users.items():
-                if key not in self.past_topic.winners:
-                    user_data['combo_count'] = 0
+            self.ledger.combo_counts = combo_counts
                 
                             
     async def broadcast_past_topic(self, client=None):
@@ -346,217 +560,129 @@ class TaskManager:
                                    Div(B("Correct answer:"), P(ans)),
                                    Div(
                                         B("Winners:"),
-                                        Table(*[Tr(Td(winner), Td(f"{(len(self.past_topic.winners) - self.past_topic.winners.index(winner)) * 10} pts")) for winner in self.past_topic.winners]),
+                                        Table(*[Tr(Td(winner), Td(f"{points} pts")) for winner, points in self.past_topic.winners]),
                                   ),
                                   cls="past-card")
 
+            if client is None:
+                await self.share_state("past_topic", broadcast.render(Div(past_topic_html, id="past_topic")))
             await self.send_to_clients(Div(past_topic_html, id="past_topic"), client)
 
     async def broadcast_current_question(self, client=None):
-        current_question_info = Div(
-            Div(
-                Div(self.current_topic.question.trivia_question, cls="trivia-question"),
-                Div(self.current_topic.user, cls="item left"),
-                Div(f"{self.current_topic.points} pts", cls="item right"),
-                cls="card"),
-            unselectedOptions()
-        )
-        await self.send_to_clients(Div(current_question_info, id="current_question_info"), client)
-
-    async def count(self):
-        self.countdown_var = env_vars.QUESTION_COUNTDOWN_SEC
-        while self.countdown_var >= 0:
-            await self.broadcast_countdown()
-            await asyncio.sleep(1)
-            self.countdown_var -= 1
+        await self.send_to_clients(self.current_question_html, client, key="current_question_info")
 
     async def broadcast_countdown(self, client=None):
-        countdown_format = self.countdown_var if self.countdown_var >= 10 else f"0{self.countdown_var}"
-        style = "color: red;" if self.countdown_var <= 5 else ""
-        countdown_div = Div(f"{countdown_format}", cls="countdown", style="text-align: center; font-size: 40px;" + style, id="countdown")
-        await self.send_to_clients(countdown_div, client)
+        await self.send_to_clients(countdown_element(self.shared["round"]["deadline"]), client)
+
+    async def resync(self, client):
+        "Bring a newly connected client up to date with the game, from whichever worker it connected to."
+        await self.broadcast_next_topics(client)
+        if "round" in self.shared:
+            await self.broadcast_current_question(client)
+            await self.broadcast_countdown(client)
+        if "past_topic" in self.shared:
+            await self.send_to_clients(self.shared["past_topic"], client)
+
+
+def current_question_element(round, question, options_html):
+    return Div(Div(
+        Div(
+            Div(question.trivia_question, cls="trivia-question"),
+            Div(round["user"], cls="item left"),
+            Div(f"{round['points']} pts", cls="item right"),
+            cls="card"),
+        NotStr(options_html)
+    ), id="current_question_info")
+
+
+def countdown_element(deadline):
+    # The client renders the ticking itself (see countdownTicker), we only send the round's end time.
+    remaining = max(0, math.ceil(deadline - time.time()))
+    return Div(f"{remaining:02d}", cls="countdown", style="text-align: center; font-size: 40px;", id="countdown",
+               data_deadline=int(deadline * 1000), data_now=int(time.time() * 1000))
 
 def ensure_db_tables():
     if players not in db.t:
         players.create(id=int, name=str, points=int, pk='id')
+    # cold rebuilds of the leaderboard read the top of this index instead of sorting the table
+    db.execute("CREATE INDEX IF NOT EXISTS players_points ON players (points DESC)")
+    # players are looked up by name on login, bid and win, and a name must have one row: first visits that race,
+    # on one worker or several, insert with ON CONFLICT(name) DO NOTHING
+    index = db.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'players_name'").fetchone()
+    if index is None or not index[0].startswith("CREATE UNIQUE"):
+        with db.conn:
+            # DBs from before the index was unique can have duplicate names. Points went to the row found last by
+            # name, the newest one, so that one stays and the others are dropped
+            dropped = db.execute("SELECT name, id, points FROM players WHERE id NOT IN (SELECT MAX(id) FROM players GROUP BY name)").fetchall()
+            for name, player_id, points in dropped:
+                logging.warning(f"Dropping duplicate player row {player_id} of {name} with {points} points, keeping the newest row")
+            db.execute("DELETE FROM players WHERE id NOT IN (SELECT MAX(id) FROM players GROUP BY name)")
+            db.execute("DROP INDEX IF EXISTS players_name")
+            db.execute("CREATE UNIQUE INDEX IF NOT EXISTS players_name ON players (name)")
+
 
-    if trivias not in db.t:
-        #bulk import from HF dataset
-        dataset = load_dataset('Mihaiii/trivia_single_choice-4-options', split='train')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-        CREATE TABLE trivias (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic TEXT NOT NULL,
-            question TEXT NOT NULL,
-            option_A TEXT NOT NULL,
-            option_B TEXT NOT NULL,
-            option_C TEXT NOT NULL,
-            option_D TEXT NOT NULL,
-            correct_option TEXT NOT NULL
-        );
-        ''')
-        conn.commit()
-        insert_query = "INSERT INTO trivias (topic, question, option_A, option_B, option_C, option_D, correct_option) VALUES (?, ?, ?, ?, ?, ?, ?)"
-        conn.execute('BEGIN TRANSACTION')
-        for record in dataset:
-            cursor.execute(insert_query, (record['topic'], record['question'], record['option_A'], record['option_B'], record['option_C'], record['option_D'], record['correct_option']))
-        conn.commit()
-        conn.close()
-        logging.debug("Count trivia rows:" + str(len(list(trivias.rows))))
-    
 async def app_startup():
+    global adb
     ensure_db_tables()
-    num_executors = 2  # Change this to run more executors
-    task_manager = TaskManager(num_executors)
+    adb = AsyncDB(db_path)
+    llm_req.start_client()
+    await llm_req.cache.open(adb)
+    backend = game_backend.create_backend(env_vars.GAME_BACKEND, f'{env_vars.DB_DIRECTORY}/game_backend.db')
+    ledger = PointsLedger(adb, os.path.dirname(db_path), backend.worker_id,
+                          None if env_vars.GAME_BACKEND == "memory" else env_vars.POINTS_FLUSH_SEC, env_vars.PLAYER_CACHE_SIZE)
+    await ledger.open()
+    asyncio.create_task(ledger.run_flusher(env_vars.POINTS_FLUSH_SEC))
+    task_manager = TaskManager(env_vars.NUM_EXECUTORS, backend, ledger, QuestionDeck(adb, env_vars.QUESTION_NO_REPEAT))
+    task_manager.leaderboard = Leaderboard(adb, ledger, 20, ledger.refresh_sec)
     app.state.task_manager = task_manager
-    results = db.q(f"SELECT {players.c.name}, {players.c.id} FROM {players}")
-    task_manager.all_users = {row['name']: row['id'] for row in results}
-    asyncio.create_task(task_manager.monitor_topics())
-    for i in range(num_executors):
-        asyncio.create_task(task_manager.run_executor(i))
+    # the questions are imported in the background on a fresh DB; rounds start as soon as the first chunk is in
+    asyncio.create_task(import_trivias(adb, env_vars.TRIVIA_SNAPSHOT, task_manager.topics_changed.set))
+    metrics.register_gauge('ws_queue_depth_max', lambda: max(task_manager.queue_depths(), default=0))
+    metrics.register_gauge('ws_queue_depth_total', lambda: sum(task_manager.queue_depths()))
+    metrics.register_gauge('is_leader', lambda: backend.is_leader)
+    await task_manager.start()
 
 
-app = FastHTML(hdrs=(css, ThemeSwitch()), ws_hdr=True, on_startup=[app_startup])
+async def app_shutdown():
+    await app.state.task_manager.backend.stop()
+    await app.state.task_manager.ledger.close()
+    await llm_req.close_client()
+    llm_req.cache.close()
+    adb.close()
+
+
+app = FastHTML(hdrs=(css, ThemeSwitch(), countdownTicker()), ws_hdr=True, on_startup=[app_startup], on_shutdown=[app_shutdown],
+               secret_key=env_vars.SESSION_SECRET_KEY)
 rt = app.route
 setup_toasts(app)
+# FastHTML deep copies the page headers (every css Style, the scripts) for every request; rendered once, that's one string.
+app.router.hdrs[:] = [NotStr(to_xml(tuple(flat_xt(app.router.hdrs))))]
 
-@rt('/choose_option_A')
-async def post(session, app):
-    if 'session_id' not in session:
-        add_toast(session, SIGN_IN_TEXT, "error")
-        return unselectedOptions()
-    
-    task_manager = app.state.task_manager
-    
-    async with task_manager.answers_lock:
-        task_manager.current_topic.answers = [a for a in task_manager.current_topic.answers if a[0] != session['session_id']]
-        task_manager.current_topic.answers.append((session['session_id'], "option_A"))
-        
-    div_a = Div(
-        Button(task_manager.current_topic.question.option_A, cls="primarly", hx_post="/choose_option_A",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_B, cls="secondary", hx_post="/choose_option_B",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_C, cls="secondary", hx_post="/choose_option_C",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_D, cls="secondary", hx_post="/choose_option_D",
-               hx_target="#question_options", disabled=True),
-        cls="options",
-        style="display: flex; flex-direction: column; gap: 10px; ",
-        id="question_options"
-    )
-    
-    for client in task_manager.online_users[session['session_id']]['ws_clients']:
-        await task_manager.send_to_clients(div_a, client)
+OPTIONS = ("option_A", "option_B", "option_C", "option_D")
 
-
-@rt('/choose_option_B')
-async def post(session):
-    if 'session_id' not in session:
-        add_toast(session, SIGN_IN_TEXT, "error")
-        return unselectedOptions()
-    
+@rt('/choose_option_{option}')
+async def post(session, option: str):
     task_manager = app.state.task_manager
-    
-    async with task_manager.answers_lock:
-        task_manager.current_topic.answers = [a for a in task_manager.current_topic.answers if a[0] != session['session_id']]
-        task_manager.current_topic.answers.append((session['session_id'], "option_B"))
-    
-    div_b = Div(
-        Button(task_manager.current_topic.question.option_A, cls="secondary", hx_post="/choose_option_A",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_B, cls="primarly", hx_post="/choose_option_B",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_C, cls="secondary", hx_post="/choose_option_C",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_D, cls="secondary", hx_post="/choose_option_D",
-               hx_target="#question_options", disabled=True),
-        cls="options",
-        style="display: flex; flex-direction: column; gap: 10px; ",
-        id="question_options"
-    )
-    
-    for client in task_manager.online_users[session['session_id']]['ws_clients']:
-        await task_manager.send_to_clients(div_b, client)
-
-
-@rt('/choose_option_C')
-async def post(session, app):
+    option = f"option_{option}"
+    if option not in OPTIONS:
+        raise HTTPException(404)
     if 'session_id' not in session:
         add_toast(session, SIGN_IN_TEXT, "error")
-        return unselectedOptions()
-    
-    task_manager = app.state.task_manager
-    
-    async with task_manager.answers_lock:
-        task_manager.current_topic.answers = [a for a in task_manager.current_topic.answers if a[0] != session['session_id']]
-        task_manager.current_topic.answers.append((session['session_id'], "option_C"))
-        
-    div_c = Div(
-        Button(task_manager.current_topic.question.option_A, cls="secondary", hx_post="/choose_option_A",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_B, cls="secondary", hx_post="/choose_option_B",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_C, cls="primarly", hx_post="/choose_option_C",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_D, cls="secondary", hx_post="/choose_option_D",
-               hx_target="#question_options", disabled=True),
-        cls="options",
-        style="display: flex; flex-direction: column; gap: 10px; ",
-        id="question_options"
-    )
-    
-    for client in task_manager.online_users[session['session_id']]['ws_clients']:
-        await task_manager.send_to_clients(div_c, client)
+        return NotStr(task_manager.option_fragments[None]),
 
+    await task_manager.submit_answer(session['session_id'], option)
+    await task_manager.send_to_user(session['session_id'], task_manager.option_fragments[option], key="question_options")
 
-@rt('/choose_option_D')
-async def post(session):
-    if 'session_id' not in session:
-        add_toast(session, SIGN_IN_TEXT, "error")
-        return unselectedOptions()
-    
-    task_manager = app.state.task_manager
-    
-    async with task_manager.answers_lock:
-        task_manager.current_topic.answers = [a for a in task_manager.current_topic.answers if a[0] != session['session_id']]
-        task_manager.current_topic.answers.append((session['session_id'], "option_D"))
-        
-    div_d = Div(
-        Button(task_manager.current_topic.question.option_A, cls="secondary", hx_post="/choose_option_A",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_B, cls="secondary", hx_post="/choose_option_B",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_C, cls="secondary", hx_post="/choose_option_C",
-               hx_target="#question_options", disabled=True),
-        Button(task_manager.current_topic.question.option_D, cls="primarly", hx_post="/choose_option_D",
-               hx_target="#question_options", disabled=True),
-        cls="options",
-        style="display: flex; flex-direction: column; gap: 10px; ",
-        id="question_options"
-    )
-    
-    for client in task_manager.online_users[session['session_id']]['ws_clients']:
-        await task_manager.send_to_clients(div_d, client)
 
+def option_fragments(question):
+    "The options panel of `question`, serialized: unselected under None, and with each option picked under its name."
+    def panel(selected):
+        buttons = [Button(getattr(question, option), cls="primary" if selected is None else "primarly" if option == selected else "secondary",
+                          hx_post=f"/choose_option_{option[-1]}", hx_target="#question_options", disabled=selected is not None)
+                   for option in OPTIONS]
+        return to_xml(Div(*buttons, cls="options", style="display: flex; flex-direction: column; gap: 10px; ", id="question_options"))
 
-def unselectedOptions():
-    task_manager = app.state.task_manager
-    return Div(
-        Button(task_manager.current_topic.question.option_A, cls="primary", hx_post="/choose_option_A",
-                hx_target="#question_options"),
-        Button(task_manager.current_topic.question.option_B, cls="primary", hx_post="/choose_option_B",
-                hx_target="#question_options"),
-        Button(task_manager.current_topic.question.option_C, cls="primary", hx_post="/choose_option_C",
-                hx_target="#question_options"),
-        Button(task_manager.current_topic.question.option_D, cls="primary", hx_post="/choose_option_D",
-                hx_target="#question_options"),
-        cls="options",
-        style="display: flex; flex-direction: column; gap: 10px; ",
-        id="question_options"
-    )
+    return {selected: panel(selected) for selected in (None,) + OPTIONS}
 
 
 def bid_form():
@@ -612,62 +738,27 @@ tabs = Nav(
 )
 
 
-@rt('/')
-async def get(session, app, request):
-    task_manager = app.state.task_manager
+LOGIN_SLOT = "<!-- login -->"
+home_shell = {}  # the / page without the login box, per HX-Request
 
-    user_id = None
-    
-    if 'session_id' in session:
-        user_id = session['session_id']
-        
-        if user_id not in task_manager.all_users:
-            task_manager.all_users[user_id] = None
-            
-        db_player = db.q(f"select * from {players} where {players.c.id} = '{task_manager.all_users[user_id]}'")
-    
-        if not db_player:
-            current_points = 20
-            players.insert({'name': user_id, 'points': current_points})
-            query = f"SELECT {players.c.id} FROM {players} WHERE {players.c.name} = ?"
-            result = db.q(query, (user_id,))
-            task_manager.all_users[user_id] = result[0]['id']
-        else:
-            current_points = db_player[0]['points']
 
-    current_question_info = Div(id="current_question_info")
+def home_page(request):
     left_panel = Div(
         Div(id="next_topics"),
         bid_form(),
         cls='side-panel'
     )
-    
-    if user_id:
-        top_right_corner = Div(user_id + ": " + str(current_points) + " pts", cls='login', id='login_points')
-    else:
-        lbtn = Div(
-            A(
-                Img(src="https://huggingface.co/datasets/huggingface/badges/resolve/main/sign-in-with-huggingface-xl.svg", id="login-badge"), href=huggingface_client.login_link_with_state()
-            )
-            , cls='login')
-        google_login_link = GoogleClient.prepare_request_uri(GoogleClient.base_url, GoogleClient.redirect_uri,
-                                                             scope='https://www.googleapis.com/auth/userinfo.email https://www.googleapis.com/auth/userinfo.profile openid')
-        google_btn = Div(
-            A(Img(src="https://developers.google.com/identity/images/branding_guideline_sample_lt_sq_lg.svg",
-                  style="width: 100%; height: auto; display: block;"), href=google_login_link), id="google")
-        top_right_corner = Div(lbtn, google_btn)
-    
     middle_panel = Div(
-        Div(top_right_corner, cls='login_wrapper'),
+        Div(NotStr(LOGIN_SLOT), cls='login_wrapper'),
         Div(id="countdown"),
-        current_question_info,
+        Div(id="current_question_info"),
         Div(Div(id="past_topic"), cls='past_topic_wrapper', style='padding-top: 10px;'),
         Div(bid_form(), cls='bid_wrapper'),
         Div(P(f"VERSION: {VERSION}"), style="padding: 200px; display: inline-flex; justify-content: center; align-items: center; text-align: center;"),
         cls="middle-panel"
     )
     right_panel = Div(
-        Div(top_right_corner),
+        Div(NotStr(LOGIN_SLOT)),
         Div(id="past_topic"),
         cls="side-panel"
     )
@@ -693,11 +784,46 @@ async def get(session, app, request):
         cls="container",
         hx_ext='ws', ws_connect='/ws'
     )
-    
-    return Title("Trivia"), Div(container, enterToBid())
+    return page_cache.render(request, Title("Trivia"), Div(container, enterToBid()))
 
-@rt("/how-to-play")
-def get(app, session):
+
+def login_buttons():
+    lbtn = Div(
+        A(
+            Img(src="https://huggingface.co/datasets/huggingface/badges/resolve/main/sign-in-with-huggingface-xl.svg", id="login-badge"), href=huggingface_client.login_link_with_state()
+        )
+        , cls='login')
+    google_login_link = GoogleClient.prepare_request_uri(GoogleClient.base_url, GoogleClient.redirect_uri,
+                                                         scope='https://www.googleapis.com/auth/userinfo.email https://www.googleapis.com/auth/userinfo.profile openid')
+    google_btn = Div(
+        A(Img(src="https://developers.google.com/identity/images/branding_guideline_sample_lt_sq_lg.svg",
+              style="width: 100%; height: auto; display: block;"), href=google_login_link), id="google")
+    return to_xml(Div(lbtn, google_btn))
+
+logged_out_login = login_buttons()
+
+
+@rt('/')
+async def get(session, app, request):
+    task_manager = app.state.task_manager
+
+    if 'session_id' in session:
+        user_id = session['session_id']
+        
+        current_points = await task_manager.ledger.get(user_id)
+        if current_points is None:
+            current_points = await task_manager.ledger.create(user_id, 20)
+        login = to_xml(Div(user_id + ": " + str(current_points) + " pts", cls='login', id='login_points'))
+    else:
+        login = logged_out_login
+
+    # The page is the same for everyone except the login box, so the shell is rendered once and only that box per user.
+    hx = 'hx-request' in request.headers
+    if hx not in home_shell:
+        home_shell[hx] = home_page(request)
+    return page_cache.response(request, ("/", login), lambda: home_shell[hx].replace(LOGIN_SLOT, login))
+
+def how_to_play_page(request):
     rules = (Div(f"Every question that you see is generated by AI. Every {env_vars.QUESTION_COUNTDOWN_SEC} seconds a new question will appear on your screen and you have to answer correctly in order to accumulate points. You get more points if more users answer correctly after you (this incentivises users to play with their friends).", style="padding: 10px; margin-top: 30px;"),
              Div("Using your points, you can bid on a new topic of your choice to appear in the future. The more points you bid the faster the topic will be shown. This means that if you bid a topic for 10 points and someone else for 5, yours will be shown first.", style="padding: 10px;"),
              Div(Div("A topic card can have one of the following statuses, depending on its current state:", style="padding: 10px;"), Ul(
@@ -708,28 +834,36 @@ def get(app, session):
                  , style="padding: 10px;")
                  )
              )
-    return Title("Trivia"), Div(tabs, rules, style="font-size: 20px;", cls="container")
+    return page_cache.render(request, Title("Trivia"), Div(tabs, rules, style="font-size: 20px;", cls="container"))
+
+@rt("/how-to-play")
+async def get(request):
+    return page_cache.response(request, "/how-to-play", lambda: how_to_play_page(request))
+
 
 @rt('/stats')
 async def get(session, app, request):
     task_manager = app.state.task_manager
-    db_player = db.q(f"select * from {players} order by points desc limit 20")
-    cells = [Tr(Td(f"{idx}.", style="padding: 5px; width: 50px; text-align: center;"), Td(row['name'], style="padding: 5px;"), Td(row['points'], style="padding: 5px; text-align: center;")) for idx, row in enumerate(db_player, start=1)]
-    with task_manager.online_users_lock:
-        c = [c for c in task_manager.online_users if c != "unassigned_clients"]
-        
-    main_content = Div(
-        Div(H2("Logged in users (" + str(len(c)) + "):"), Div(", ".join(c))),
-        Div(H1("Leaderboard", style="text-align: center;"), Table(Tr(Th(B("Rank")), Th(B('HuggingFace Username')), Th(B("Points"), style="text-align: center;")), *cells))
-    )
-    return Title("Trivia"), Div(
-        tabs,
-        main_content,
-        cls="container"
-    )
+    top = await task_manager.leaderboard.top()
+    c = task_manager.all_online_users()
+
+    def stats_page():
+        metrics.inc("stats_renders")
+        cells = [Tr(Td(f"{idx}.", style="padding: 5px; width: 50px; text-align: center;"), Td(name, style="padding: 5px;"), Td(points, style="padding: 5px; text-align: center;")) for idx, (name, points) in enumerate(top, start=1)]
+        main_content = Div(
+            Div(H2("Logged in users (" + str(len(c)) + "):"), Div(", ".join(c))),
+            Div(H1("Leaderboard", style="text-align: center;"), Table(Tr(Th(B("Rank")), Th(B('HuggingFace Username')), Th(B("Points"), style="text-align: center;")), *cells))
+        )
+        return page_cache.render(request, Title("Trivia"), Div(
+            tabs,
+            main_content,
+            cls="container"
+        ))
 
-@rt('/faq')
-async def get(session, app, request):
+    # rendered again only when the leaderboard or the logged in users change
+    return page_cache.response(request, ("/stats", task_manager.leaderboard.version, tuple(c)), stats_page)
+
+def faq_page(request):
     qa = [
         ("I press the Sign in button, but nothing happens. Why?", 
         "You're probably accessing https://huggingface.co/spaces/Mihaiii/Trivia. Please use https://mihaiii-trivia.hf.space/ instead."),
@@ -763,11 +897,24 @@ async def get(session, app, request):
     ]
 
     main_content = Ul(*[Li(Strong(pair[0]), Br(), P(pair[1])) for pair in qa], style="padding: 10px; font-size: 20px;")
-    return Title("Trivia"), Div(
+    return page_cache.render(request, Title("Trivia"), Div(
         tabs,
         main_content,
         cls="container"
-    )
+    ))
+
+@rt('/faq')
+async def get(request):
+    return page_cache.response(request, "/faq", lambda: faq_page(request))
+
+@rt("/metrics")
+def get():
+    return JSONResponse(metrics.snapshot())
+
+@rt("/health")
+def get():
+    return JSONResponse({"topic_check": llm_req.topic_check_pool.health(),
+                         "generate_question": llm_req.generate_question_pool.health()})
 
 @rt("/bid")
 async def post(session, topic: str, points: int):
@@ -794,71 +941,45 @@ async def post(session, topic: str, points: int):
 
     task_manager = app.state.task_manager
 
-    async with task_manager.topics_lock:
-        if similar(topic, task_manager.current_topic.topic) >= env_vars.DUPLICATE_TOPIC_THRESHOLD:
+    for t in task_manager.topic_names():
+        if similar(t, topic) >= env_vars.DUPLICATE_TOPIC_THRESHOLD:
             add_toast(session, f"Topic '{topic}' is very similar with an existing one. Please request another topic.")
             return bid_form()
 
-        for t in task_manager.topics:
-            if similar(t.topic, topic) >= env_vars.DUPLICATE_TOPIC_THRESHOLD:
-                add_toast(session, f"Topic '{topic}' is very similar with an existing one. Please request another topic.")
-                return bid_form()
-            
-        if task_manager.past_topic:
-            if similar(t.topic, task_manager.past_topic.topic) >= env_vars.DUPLICATE_TOPIC_THRESHOLD:
-                add_toast(session, f"Topic '{topic}' is very similar with an existing one. Please request another topic.")
-                return bid_form()
-
     if 'session_id' in session:
         user_id = session['session_id']
-        db_player = db.q(f"select * from {players} where {players.c.id} = '{task_manager.all_users[user_id]}'")
-        if db_player[0]['points'] - points >= 0:
-            db_player[0]['points'] -= points
-            players.update(db_player[0])
+        current_points = await task_manager.ledger.get(user_id)
+        if current_points is not None and current_points - points >= 0:
+            [current_points] = await task_manager.ledger.adjust([(user_id, -points)])
 
-            await task_manager.add_user_topic(topic=topic, points=points, user_id=user_id)
-            elem = Div(user_id + ": " + str(db_player[0]['points']) + " pts", cls='login', id='login_points')
+            await task_manager.submit_bid(topic=topic, points=points, user_id=user_id)
+            elem = Div(user_id + ": " + str(current_points) + " pts", cls='login', id='login_points')
 
-            for client in task_manager.online_users[user_id]['ws_clients']:
-                await task_manager.send_to_clients(elem, client)
+            await task_manager.send_to_user(user_id, elem)
         else:
             add_toast(session, "Not enough points", "error")
     return bid_form()
 
 
 async def on_connect(send, ws):
-    client_key = "unassigned_clients"
+    client_key = UNASSIGNED
     if ws.scope['session'] and ws.scope['session']['session_id']:
         client_key = ws.scope['session']['session_id']        
     task_manager = app.state.task_manager
-    with task_manager.online_users_lock:
-        if client_key not in task_manager.online_users:
-            task_manager.online_users[client_key] = { 'ws_clients': set(), 'combo_count': 0}
-        task_manager.online_users[client_key]['ws_clients'].add(send)
-    await task_manager.broadcast_next_topics(send)
-    if task_manager.current_topic:
-        await task_manager.broadcast_current_question(send)
-    await task_manager.broadcast_past_topic(send)
+    conn = broadcast.ClientConnection(ws, send, env_vars.WS_MAX_QUEUE, env_vars.WS_SEND_TIMEOUT_SEC, on_close=task_manager.remove_client)
+    task_manager.online_users.add(client_key, conn)
+    await task_manager.resync(conn)
 
 
-async def on_disconnect(send, session):
+async def on_disconnect(ws, session):
     logging.debug("Calling on_disconnect")
     logging.debug(len(app.state.task_manager.online_users))
     task_manager = app.state.task_manager
-    with task_manager.online_users_lock:
-        key_to_remove = None
-        for key, user_data in task_manager.online_users.items():
-            if send in user_data['ws_clients']:
-                user_data['ws_clients'].remove(send)
-                if len(user_data['ws_clients']) == 0:
-                    key_to_remove = key
-                break
-            
-        if key_to_remove:
-            task_manager.online_users.pop(key_to_remove)
-                    
-        if session:
-            session['session_id'] = None
+    conn = task_manager.online_users.remove_ws(ws)
+    if session:
+        session['session_id'] = None
+    if conn:
+        conn.close()
 
 
 @app.ws('/ws', conn=on_connect, disconn=on_disconnect)
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",  # readers don't block the writer and the writer doesn't block readers
+    "PRAGMA synchronous = NORMAL",  # with WAL this is still safe against corruption, and commits don't fsync
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",  # 16 MB
+]
+
+
+class AsyncDB:
+    """SQLite from async code: every statement runs on one dedicated thread that owns the connection.
+
+    The event loop only waits on a future, so a slow disk stalls DB callers but never the websockets.
+    Time spent queued behind other statements is exposed as the `db_queue_wait_ms` metrics.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self.conn = None
+        self.executor.submit(self._connect).result()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+
+    async def run(self, fn, *args):
+        "Run `fn(conn, *args)` on the DB thread and return its result."
+        submitted = time.monotonic()
+
+        def call():
+            wait_ms = (time.monotonic() - submitted) * 1000
+            metrics.set_gauge("db_queue_wait_ms", round(wait_ms, 2))
+            metrics.set_gauge("db_queue_wait_ms_max", max(metrics.gauges.get("db_queue_wait_ms_max", 0), round(wait_ms, 2)))
+            metrics.inc("db_statements")
+            return fn(self.conn, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def q(self, sql, params=()):
+        "Rows of a parameterized query, as dicts."
+        return await self.run(lambda c: [dict(row) for row in c.execute(sql, params).fetchall()])
+
+    async def execute(self, sql, params=()):
+        "Run one parameterized statement and return the id of the last inserted row."
+        return await self.run(lambda c: c.execute(sql, params).lastrowid)
+
+    async def transaction(self, fn, *args):
+        "Run `fn(conn, *args)` inside BEGIN IMMEDIATE / COMMIT, rolling back if it raises."
+        def call(conn, *args):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await self.run(call, *args)
+
+    def close(self):
+        self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
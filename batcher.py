@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import metrics
+
+
+class Batcher:
+    """Collects items submitted within `window_sec` (or until `max_size` are waiting) and handles them with one call.
+
+    `run_batch(items)` returns one result per item, or None when the batch failed; every item then falls back
+    to `run_single(item)`. A batch of one goes straight to `run_single`.
+    """
+
+    def __init__(self, name, window_sec, max_size, run_batch, run_single):
+        self.name = name
+        self.window_sec = window_sec
+        self.max_size = max_size
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.waiting = []
+        self.full = asyncio.Event()
+        self.flusher = None
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append((item, future))
+        if len(self.waiting) >= self.max_size:
+            self.full.set()
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        try:
+            await asyncio.wait_for(self.full.wait(), self.window_sec)
+        except asyncio.TimeoutError:
+            pass
+        while self.waiting:
+            batch, self.waiting = self.waiting[:self.max_size], self.waiting[self.max_size:]
+            asyncio.create_task(self._run(batch))
+        self.full.clear()
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        results = None
+        if len(items) > 1:
+            metrics.inc(f"{self.name}_batches")
+            metrics.inc(f"{self.name}_batched_items", len(items))
+            try:
+                results = await self.run_batch(items)
+            except Exception as e:
+                logging.debug(f"{self.name} batch of {len(items)} failed: {e}")
+            if results is None or len(results) != len(items):
+                metrics.inc(f"{self.name}_batch_fallbacks")
+                results = None
+        if results is None:
+            results = await asyncio.gather(*[self.run_single(item) for item in items], return_exceptions=True)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
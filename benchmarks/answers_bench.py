@@ -0,0 +1,50 @@
+"""Answer ingestion and round scoring for 10k simulated answers.
+
+Compares the old path (rebuilding the answers list on every click, winners.index() per winner) with AnswerStore.
+
+    python benchmarks/answers_bench.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from answer_store import AnswerStore
+
+NR_ANSWERS = 10_000
+NR_USERS = 8_000
+OPTIONS = ["option_A", "option_B", "option_C", "option_D"]
+
+
+def old_round(clicks, correct):
+    answers = []
+    for user, option in clicks:
+        answers = [a for a in answers if a[0] != user]
+        answers.append((user, option))
+    winners = [a[0] for a in answers if a[1] == correct]
+    return [(winner, (len(winners) - winners.index(winner)) * 10) for winner in winners]
+
+
+def new_round(clicks, correct):
+    answers = AnswerStore()
+    for user, option in clicks:
+        answers.add(user, option)
+    return answers.score(correct)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    random.seed(1)
+    clicks = [(f"user{random.randrange(NR_USERS)}", random.choice(OPTIONS)) for _ in range(NR_ANSWERS)]
+    old, old_sec = timed(old_round, clicks, "option_B")
+    new, new_sec = timed(new_round, clicks, "option_B")
+    assert old == new
+    print(f"{NR_ANSWERS} answers from {NR_USERS} users, {len(new)} winners")
+    print(f"old: {old_sec * 1000:9.1f} ms  ({old_sec / NR_ANSWERS * 1e6:.1f} us per answer incl. scoring)")
+    print(f"new: {new_sec * 1000:9.1f} ms  ({new_sec / NR_ANSWERS * 1e6:.1f} us per answer incl. scoring)")
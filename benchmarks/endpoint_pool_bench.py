@@ -0,0 +1,91 @@
+"""Topic checks spread over several local stub completion servers: one fast, one with a slow tail and one that is down.
+
+Shows the least-outstanding split, the hedged requests cutting the tail and the circuit breaker taking the broken
+server out of rotation, compared with sending everything to a single server with a slow tail.
+
+    python benchmarks/endpoint_pool_bench.py
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import llm_req
+import metrics
+from endpoint_pool import EndpointPool
+
+NR_CALLS = 300
+CONCURRENCY = 8
+
+
+class StubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # the losing side of a hedge is cancelled and its connection closed mid-response
+
+
+def stub_server(delay, slow_tail=0.0, broken=False):
+    class StubCompletion(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(1.0 if random.random() < slow_tail else delay)
+            body = json.dumps({"content": "No"}).encode()
+            self.send_response(500 if broken else 200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = StubServer(("127.0.0.1", 0), StubCompletion)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/completion"
+
+
+async def run(pool):
+    llm_req.topic_check_pool = pool
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            result = await llm_req._topic_check("volcanoes")
+            latencies.append((time.perf_counter() - started) if result == "No" else None)
+
+    await asyncio.gather(*[one() for _ in range(NR_CALLS)])
+    ok = sorted(latency for latency in latencies if latency is not None)
+    return len(latencies) - len(ok), ok[len(ok) // 2], ok[int(len(ok) * 0.99)]
+
+
+async def main():
+    random.seed(1)
+    servers = [stub_server(0.02), stub_server(0.02, slow_tail=0.05), stub_server(0.02, broken=True)]
+    fast, slow, broken = [url for _, url in servers]
+    llm_req.start_client()
+
+    for name, pool in [("single server", EndpointPool("topic_check", [slow], hedge=False)),
+                       ("pool of three", EndpointPool("topic_check", [fast, slow, broken]))]:
+        metrics.counters.clear()
+        failed, p50, p99 = await run(pool)
+        print(f"{name}: {NR_CALLS} calls, {failed} failed, p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms")
+        print(f"  counters: {dict(metrics.counters)}")
+        for endpoint in pool.health()["endpoints"]:
+            print(f"  {endpoint['url']}: {endpoint['state']}, {endpoint['requests']} requests, {endpoint['failures']} failures")
+
+    await llm_req.close_client()
+    for server, _ in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
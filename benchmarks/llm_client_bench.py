@@ -0,0 +1,78 @@
+"""Per-call latency of the topic check request against a local stub completion server.
+
+Compares the old path (a new httpx.AsyncClient, so a new connection, for every call) with the shared pooled
+client. The stub answers instantly, so the difference is the client and connection setup. Against the real
+servers every new connection also pays a TLS handshake and a network round trip or two on top of this.
+
+    python benchmarks/llm_client_bench.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import llm_req
+from endpoint_pool import EndpointPool
+
+NR_CALLS = 200
+
+
+class StubCompletion(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"content": "No"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def timed_calls(before_call, after_call):
+    latencies = []
+    for _ in range(NR_CALLS):
+        started = time.perf_counter()
+        await before_call()
+        assert await llm_req._topic_check("volcanoes") == "No"
+        await after_call()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return sum(latencies) / len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+async def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCompletion)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm_req.topic_check_pool = EndpointPool("topic_check", [f"http://127.0.0.1:{server.server_port}/completion"])
+
+    async def new_client():
+        llm_req.start_client()
+
+    async def nothing():
+        pass
+
+    per_call = await timed_calls(new_client, llm_req.close_client)
+    llm_req.start_client()
+    await timed_calls(nothing, nothing)  # warm up the pool
+    pooled = await timed_calls(nothing, nothing)
+    await llm_req.close_client()
+    server.shutdown()
+
+    print(f"{NR_CALLS} calls       mean ms   p50 ms   p99 ms")
+    for name, (mean, p50, p99) in [("client per call", per_call), ("pooled client", pooled)]:
+        print(f"{name:<18}{mean * 1000:8.2f}{p50 * 1000:9.2f}{p99 * 1000:9.2f}")
+    print(f"saved per call: {(per_call[0] - pooled[0]) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""Requests per second for the logged out /, /faq and /how-to-play, rendered on every request vs from the page cache.
+
+Before mode is the work every request did before the page cache: the login buttons, the whole FT tree and the app's
+headers, still as FT to deep copy, are built and rendered for every request, uncompressed. Cached mode is what a
+browser gets: gzip, or brotli when installed, and a 304 when it sends back the ETag. Requests are fed straight to the
+ASGI app, so only the server side is measured.
+
+    python benchmarks/page_cache_bench.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ["DB_DIRECTORY"] = tempfile.mkdtemp()
+os.environ.setdefault("SESSION_SECRET_KEY", "bench")
+import app as appmod
+from fasthtml.common import FastHTML
+from fasthtml.toaster import setup_toasts
+
+logging.disable(logging.WARNING)
+PAGES = ["/", "/faq", "/how-to-play"]
+DURATION_SEC = 2
+
+
+async def get(path, headers):
+    "(status, headers, body) of a GET handled by the app."
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+             "client": ("127.0.0.1", 1234), "server": ("bench", 80)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await appmod.app(scope, receive, send)
+    return (sent[0]["status"], {k.decode(): v.decode() for k, v in sent[0]["headers"]},
+            b"".join(m.get("body", b"") for m in sent[1:]))
+
+
+def original_hdrs():
+    "The page headers as app.py sets them up, before they're rendered into one string."
+    twin = FastHTML(hdrs=(appmod.css, appmod.ThemeSwitch(), appmod.countdownTicker()), ws_hdr=True)
+    setup_toasts(twin)
+    return list(twin.router.hdrs)
+
+
+def uncached(path):
+    appmod.page_cache.pages.clear()
+    appmod.home_shell.clear()
+    if path == "/":
+        appmod.logged_out_login = appmod.login_buttons()
+
+
+async def rate(path, headers, before_request=lambda: None):
+    n = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION_SEC:
+        before_request()
+        response = await get(path, headers)
+        assert response[0] in (200, 304)
+        n += 1
+    return n / (time.perf_counter() - started), response
+
+
+async def main():
+    appmod.app.state.task_manager = None  # the logged out / doesn't touch the game
+    # without the lifespan: the pages don't need the DB or the game loop
+    rendered_hdrs, hdrs = list(appmod.app.router.hdrs), original_hdrs()
+    print(f"{'page':<14}{'before':>12}{'cached':>12}{'304':>12}   bytes plain -> sent")
+    for path in PAGES:
+        appmod.app.router.hdrs[:] = hdrs
+        before, (_, _, plain) = await rate(path, {"Accept-Encoding": "identity"}, lambda: uncached(path))
+        appmod.app.router.hdrs[:] = rendered_hdrs
+        cached, (_, headers, compressed) = await rate(path, {"Accept-Encoding": "gzip, br"})
+        not_modified, _ = await rate(path, {"Accept-Encoding": "gzip, br", "If-None-Match": headers["etag"]})
+        print(f"{path:<14}{before:>9.0f}/s{cached:>9.0f}/s{not_modified:>9.0f}/s   {len(plain)} -> {len(compressed)} "
+              f"({headers.get('content-encoding')})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
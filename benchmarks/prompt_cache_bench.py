@@ -0,0 +1,101 @@
+"""Prompt tokens evaluated per topic check and per question generation, before and after the prefix-cache layout.
+
+The stub server imitates llama.cpp's prompt cache: with `cache_prompt` a slot keeps the tokens of its last prompt
+and only evaluates what comes after the longest common prefix; without it every prompt is evaluated in full.
+Tokens are approximated by words and punctuation.
+
+    python benchmarks/prompt_cache_bench.py
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import llm_req
+import metrics
+from endpoint_pool import EndpointPool
+
+TOPICS = ["football", "Harry Potter", "volcanoes", "jazz", "the roman empire", "chess", "sushi", "black holes",
+          "formula 1", "impressionism", "honey bees", "the moon landing"] * 4
+QUESTION = {"trivia question": "?", "option A": "a", "option B": "b", "option C": "c", "option D": "d", "correct answer": "option A"}
+
+
+def old_question_check_prompt(raw_prompt):
+    "The layout before this change: the topic sits between the introduction and the policies."
+    intro, policies = llm_req.QUESTION_CHECK_PROMPT_PREFIX.split("\n\nOur safety principles", 1)
+    policies = "Our safety principles" + policies.rsplit("\n\n<start_of_turn>", 1)[0].replace("the human prompt below", "the human prompt")
+    return f"{intro}\n\n<start_of_turn>\nHuman Question: {raw_prompt}\n<end_of_turn>\n\n{policies}\n"
+
+
+def tokenize(text):
+    return re.findall(r"\w+|[^\w\s]|\s+", text)
+
+
+class StubLlamaServer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    slot_cache = []
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        tokens = tokenize(data["prompt"])
+        reused = 0
+        if data.get("cache_prompt"):
+            for cached, new in zip(self.slot_cache, tokens):
+                if cached != new:
+                    break
+                reused += 1
+        type(self).slot_cache = tokens
+        content = json.dumps(QUESTION) if "json_schema" in data else "No"
+        body = json.dumps({"content": content, "timings": {"prompt_n": len(tokens) - reused}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def prompt_tokens_per_call():
+    metrics.counters.clear()
+    for topic in TOPICS:
+        await llm_req._topic_check(topic)
+        await llm_req._generate_question(topic)
+    return (metrics.counters["topic_check_prompt_eval_tokens_total"] / len(TOPICS),
+            metrics.counters["generate_question_prompt_eval_tokens_total"] / len(TOPICS))
+
+
+async def main():
+    servers = []
+    for _ in range(2):
+        handler = type("Slot", (StubLlamaServer,), {"slot_cache": []})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    llm_req.topic_check_pool = EndpointPool("topic_check", [f"http://127.0.0.1:{servers[0].server_port}/completion"])
+    llm_req.generate_question_pool = EndpointPool("generate_question", [f"http://127.0.0.1:{servers[1].server_port}/completion"])
+    llm_req.start_client()
+
+    new_prompt, new_options = llm_req._question_check_prompt, llm_req._prompt_cache_options
+    llm_req._question_check_prompt, llm_req._prompt_cache_options = old_question_check_prompt, lambda slot: {}
+    before = await prompt_tokens_per_call()
+    llm_req._question_check_prompt, llm_req._prompt_cache_options = new_prompt, new_options
+    after = await prompt_tokens_per_call()
+
+    print(f"prompt tokens evaluated per call over {len(TOPICS)} topics")
+    print(f"{'':20}{'before':>8}{'after':>8}")
+    print(f"{'topic_check':20}{before[0]:8.1f}{after[0]:8.1f}")
+    print(f"{'generate_question':20}{before[1]:8.1f}{after[1]:8.1f}")
+    await llm_req.close_client()
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
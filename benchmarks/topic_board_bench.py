@@ -0,0 +1,78 @@
+"""Messages and bytes sent for the #next_topics board during one simulated round.
+
+Compares the old path (the whole board re-rendered and pushed on every status change) with TopicBoard
+(per-card deltas, changes coalesced within a window).
+
+    python benchmarks/topic_board_bench.py
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fasthtml.common import Div
+from broadcast import render
+from topic_board import TopicBoard, render_card
+
+NR_USERS = 300
+NR_SLOTS = 5
+WINDOW = 0.1
+# Time is compressed so the benchmark runs in about a second; the window is scaled the same way.
+TIME_SCALE = 0.05
+
+
+def round_events(topics):
+    "A busy round: DB refill, executors flipping topics one by one, a few bids going through the whole lifecycle."
+    events = []
+    db_topics = [SimpleNamespace(topic=f"db topic {i}", user="[bot]", points=0, status="pending") for i in range(20)]
+    events.append((0, lambda: topics.extend(db_topics)))
+    for i, t in enumerate(db_topics[:8]):
+        events.append((1 + i * 0.05, lambda t=t: setattr(t, "status", "successful")))
+    for i in range(4):
+        bid = SimpleNamespace(topic=f"user topic {i}", user=f"user{i}", points=10 + i, status="pending")
+        at = 2 + i * 0.02
+        events.append((at, lambda bid=bid: (topics.insert(0, bid), topics.sort(key=lambda t: -t.points))))
+        events.append((at + 1, lambda bid=bid: setattr(bid, "status", "computing")))
+        events.append((at + 4, lambda bid=bid: setattr(bid, "status", "successful" if bid.points % 2 else "failed")))
+        events.append((at + 9, lambda bid=bid: bid.status == "failed" and topics.remove(bid)))
+    return sorted(events, key=lambda e: e[0])
+
+
+async def full_board():
+    topics, sent = [], []
+    now = 0
+    for at, mutate in round_events(topics):
+        await asyncio.sleep((at - now) * TIME_SCALE)
+        now = at
+        mutate()
+        sent.append(render(Div(*[render_card(slot, t) for slot, t in enumerate(topics[:NR_SLOTS])], id="next_topics")))
+    return sent
+
+
+async def incremental_board():
+    topics, sent = [], []
+
+    async def send(payload):
+        sent.append(payload)
+
+    board = TopicBoard(lambda: topics, NR_SLOTS, WINDOW * TIME_SCALE, send)
+    now = 0
+    for at, mutate in round_events(topics):
+        await asyncio.sleep((at - now) * TIME_SCALE)
+        now = at
+        mutate()
+        board.changed()
+    await asyncio.sleep(WINDOW * TIME_SCALE * 2)
+    return sent
+
+
+def report(name, sent):
+    nr_bytes = sum(len(p.encode()) for p in sent)
+    print(f"{name:<12} broadcasts: {len(sent):>4}  messages: {len(sent) * NR_USERS:>6}  bytes: {nr_bytes * NR_USERS:>10}")
+
+
+if __name__ == "__main__":
+    print(f"{NR_USERS} connected clients, {NR_SLOTS} cards shown")
+    report("full board", asyncio.run(full_board()))
+    report("incremental", asyncio.run(incremental_board()))
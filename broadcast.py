@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from collections import deque
+from fasthtml.common import to_xml
+import metrics
+
+
+def render(element):
+    "Serialize an FT element once so the same bytes can be written to every socket."
+    if element is None or isinstance(element, str):
+        return element
+    return to_xml(element)
+
+
+def supersede_key(element):
+    "Fragments that replace an element by id make older queued fragments for the same id stale."
+    attrs = getattr(element, 'attrs', None)
+    if not attrs or 'hx-swap-oob' in attrs:
+        return None
+    return attrs.get('id')
+
+
+class ClientConnection:
+    "A websocket with a bounded outbound queue drained by its own writer task."
+
+    def __init__(self, ws, send, max_queue, send_timeout, on_close=None):
+        self.ws = ws
+        self.send = send
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def push(self, payload, key=None):
+        if self.closed:
+            return False
+        if key is not None:
+            # only a newer copy of the same element makes a queued message stale; anything else still queued is live
+            self._drop_first(lambda k: k == key)
+        if len(self.queue) >= self.max_queue:
+            logging.debug(f"Evicting slow client, {len(self.queue)} messages queued")
+            metrics.inc('ws_evictions')
+            self.close()
+            return False
+        self.queue.append((key, payload))
+        self.ready.set()
+        return True
+
+    def _drop_first(self, match):
+        for i, (k, _) in enumerate(self.queue):
+            if match(k):
+                del self.queue[i]
+                metrics.inc('ws_superseded_drops')
+                return True
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                _, payload = self.queue.popleft()
+                await asyncio.wait_for(self.send(payload), self.send_timeout)
+                metrics.inc('ws_messages_sent')
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.debug(f"Websocket send failed: {e}")
+            metrics.inc('ws_send_failures')
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        asyncio.create_task(self._close_ws())
+        if self.on_close:
+            self.on_close(self)
+
+    async def _close_ws(self):
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+
+def publish(connections, element, key=None):
+    "Render `element` once and queue it on every connection. Never waits on a socket."
+    payload = render(element)
+    if not payload:
+        return
+    if key is None:
+        key = supersede_key(element)
+    for conn in list(connections):
+        conn.push(payload, key)
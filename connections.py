@@ -0,0 +1,51 @@
+UNASSIGNED = "unassigned_clients"
+
+
+class ConnectionRegistry:
+    """Online users and their websocket connections, indexed both ways.
+
+    Only touched from the event loop and never across an await, so it needs no lock.
+    """
+
+    def __init__(self):
+        self.by_ws = {}
+        self.owner = {}
+        self.by_user = {}
+
+    def add(self, user, conn):
+        self.by_ws[conn.ws] = conn
+        self.owner[conn] = user
+        self.by_user.setdefault(user, set()).add(conn)
+
+    def remove(self, conn):
+        "Forget `conn`. Returns its user, or None if it was already removed."
+        user = self.owner.pop(conn, None)
+        if user is None:
+            return None
+        self.by_ws.pop(conn.ws, None)
+        conns = self.by_user[user]
+        conns.discard(conn)
+        if not conns:
+            del self.by_user[user]
+        return user
+
+    def remove_ws(self, ws):
+        conn = self.by_ws.get(ws)
+        if conn is not None:
+            self.remove(conn)
+        return conn
+
+    def connections(self, user=None):
+        if user is None:
+            return list(self.owner)
+        return list(self.by_user.get(user, ()))
+
+    def users(self):
+        "Logged in users that have at least one open connection."
+        return [user for user in self.by_user if user != UNASSIGNED]
+
+    def __len__(self):
+        return len(self.by_user)
+
+    def is_online(self, user):
+        return user in self.by_user
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import deque
+import metrics
+
+
+class Endpoint:
+    "One completion server: outstanding requests, recent latencies and a circuit breaker."
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latencies = deque(maxlen=100)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.requests = 0
+        self.failures = 0
+
+    def state(self, cooldown_sec):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= cooldown_sec:
+            return "half-open"
+        return "open"
+
+
+class EndpointPool:
+    """Spreads requests for one stage over several servers.
+
+    Requests go to the available endpoint with the fewest outstanding requests. When a request takes longer than
+    the pool's recent p95, a hedged duplicate goes to another endpoint and the first answer wins. After
+    `failures_to_open` failures in a row an endpoint is skipped for `cooldown_sec`, then gets one trial request
+    that closes the breaker again if it succeeds. A request that fails is retried once on another endpoint.
+    """
+
+    def __init__(self, name, urls, failures_to_open=3, cooldown_sec=30.0, hedge=True, min_samples=10):
+        self.name = name
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failures_to_open = failures_to_open
+        self.cooldown_sec = cooldown_sec
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=200)
+
+    def pick(self, exclude=()):
+        candidates = []
+        for endpoint in self.endpoints:
+            state = endpoint.state(self.cooldown_sec)
+            if endpoint in exclude or state == "open" or (state == "half-open" and endpoint.trial_running):
+                continue
+            candidates.append(endpoint)
+        if not candidates:
+            return None
+        endpoint = min(candidates, key=lambda e: e.outstanding)
+        if endpoint.state(self.cooldown_sec) == "half-open":
+            endpoint.trial_running = True
+        return endpoint
+
+    def hedge_delay(self):
+        if not self.hedge or len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    async def request(self, send):
+        """`await send(url)` on the best endpoint, hedging slow requests. Raises the last error if every attempt fails.
+
+        An exception from `send` counts as a failure of that endpoint; anything it returns is an answer.
+        """
+        first = self.pick()
+        if first is None:
+            metrics.inc(f"llm_{self.name}_no_endpoint")
+            raise RuntimeError(f"No {self.name} endpoint available")
+        attempts = {asyncio.create_task(self._attempt(first, send)): first}
+        tried = [first]
+        hedged = False
+        error = None
+        try:
+            while attempts:
+                timeout = None if hedged else self.hedge_delay()
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    second = self.pick(exclude=tried)
+                    if second is not None:
+                        metrics.inc(f"llm_{self.name}_hedged")
+                        logging.debug(f"Hedging {self.name} request to {second.url}")
+                        attempts[asyncio.create_task(self._attempt(second, send))] = second
+                        tried.append(second)
+                    continue
+                for task in done:
+                    endpoint = attempts.pop(task)
+                    if task.exception() is None:
+                        if endpoint is not first and hedged:
+                            metrics.inc(f"llm_{self.name}_hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if not attempts:
+                    # fail over once to an endpoint that wasn't tried yet
+                    retry = self.pick(exclude=tried) if len(tried) < 2 else None
+                    if retry is not None:
+                        metrics.inc(f"llm_{self.name}_failovers")
+                        attempts[asyncio.create_task(self._attempt(retry, send))] = retry
+                        tried.append(retry)
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def _attempt(self, endpoint, send):
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        started = time.monotonic()
+        try:
+            result = await send(endpoint.url)
+        except asyncio.CancelledError:
+            endpoint.trial_running = False
+            raise
+        except Exception as e:
+            self._failed(endpoint, e)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        latency = time.monotonic() - started
+        endpoint.latencies.append(latency)
+        self.latencies.append(latency)
+        endpoint.consecutive_failures = 0
+        endpoint.opened_at = None
+        endpoint.trial_running = False
+        return result
+
+    def _failed(self, endpoint, error):
+        logging.debug(f"{self.name} request to {endpoint.url} failed: {error!r}")
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        endpoint.trial_running = False
+        if endpoint.opened_at is not None or endpoint.consecutive_failures >= self.failures_to_open:
+            if endpoint.opened_at is None:
+                logging.warning(f"Circuit opened for {self.name} endpoint {endpoint.url}")
+                metrics.inc(f"llm_{self.name}_circuit_opened")
+            endpoint.opened_at = time.monotonic()
+
+    def health(self):
+        hedge_delay = self.hedge_delay()
+        return {
+            "hedge_after_sec": round(hedge_delay, 3) if hedge_delay is not None else None,
+            "endpoints": [{
+                "url": e.url,
+                "state": e.state(self.cooldown_sec),
+                "outstanding": e.outstanding,
+                "requests": e.requests,
+                "failures": e.failures,
+                "consecutive_failures": e.consecutive_failures,
+                "avg_latency_sec": round(sum(e.latencies) / len(e.latencies), 3) if e.latencies else None,
+            } for e in self.endpoints],
+        }
@@ -12,9 +12,19 @@ MAX_TOPIC_LENGTH_CHARS = int(os.environ.get("MAX_TOPIC_LENGTH_CHARS", 30))
 # AUTOMATICALLY ADD TOPICS IF THE USERS DON'T BID/PROPOSE NEW ONES
 MAX_NR_TOPICS_FOR_ALLOW_MORE = int(os.environ.get("MAX_NR_TOPICS_FOR_ALLOW_MORE", 20))
 
+# BOUNDS FOR THE NUMBER OF READY (SUCCESSFUL) TOPICS KEPT AHEAD OF THE ROUNDS. THE ACTUAL TARGET FOLLOWS THE OBSERVED LLM LATENCY
+READY_TOPICS_MIN = int(os.environ.get("READY_TOPICS_MIN", 2))
+READY_TOPICS_MAX = int(os.environ.get("READY_TOPICS_MAX", 6))
+
+# START GENERATING THE QUESTION FOR A USER TOPIC AT THE SAME TIME AS ITS SAFETY CHECK. THE QUESTION IS DISCARDED IF THE CHECK FAILS
+SPECULATIVE_GENERATION = os.environ.get("SPECULATIVE_GENERATION", "false").lower() in ("1", "true", "yes")
+
 # NUMBER OF TOPICS TO APPEAR IN THE UI. THE ACTUAL LIST CAN CONTAIN MORE THAN THIS.
 NR_TOPICS_TO_BROADCAST = int(os.environ.get("NR_TOPICS_TO_BROADCAST", 5))
 
+# TOPIC LIST CHANGES MADE WITHIN THIS WINDOW ARE MERGED INTO ONE BROADCAST
+TOPIC_BOARD_COALESCE_MS = int(os.environ.get("TOPIC_BOARD_COALESCE_MS", 100))
+
 # MINIMUM NUMBER OF POINTS REQUIRED TO PLACE A TOPIC BID IN THE UI
 BID_MIN_POINTS = int(os.environ.get("BID_MIN_POINTS", 3))
     
@@ -29,6 +39,86 @@ COMBO_CONSECUTIVE_NR_FOR_WIN = int(os.environ.get("COMBO_CONSECUTIVE_NR_FOR_WIN"
 #How many points does a combo bonus offer?
 COMBO_WIN_POINTS = int(os.environ.get("COMBO_WIN_POINTS", 50))
 
+# MAX SECONDS TO WAIT FOR A SINGLE WEBSOCKET SEND BEFORE TREATING THE CLIENT AS DISCONNECTED
+WS_SEND_TIMEOUT_SEC = float(os.environ.get("WS_SEND_TIMEOUT_SEC", 5))
+
+# MAX NUMBER OF MESSAGES QUEUED FOR A SINGLE WEBSOCKET BEFORE STALE ONES ARE DROPPED OR THE CLIENT IS DISCONNECTED
+WS_MAX_QUEUE = int(os.environ.get("WS_MAX_QUEUE", 32))
+
+# HOW WORKERS SHARE ONE GAME: "memory" FOR A SINGLE WORKER, "sqlite" FOR SEVERAL WORKERS/PODS THAT CAN REACH THE SAME DB_DIRECTORY
+GAME_BACKEND = os.environ.get("GAME_BACKEND", "memory")
+
+# CONNECTION POOL FOR THE LLM COMPLETION SERVERS. IDLE CONNECTIONS ARE KEPT ALIVE SO CALLS SKIP THE TCP/TLS HANDSHAKE
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY_SEC = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SEC", 60))
+
+# USE HTTP/2 FOR THE LLM COMPLETION SERVERS. NEEDS THE h2 PACKAGE (pip install httpx[http2])
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# TIMEOUTS FOR THE LLM COMPLETION SERVERS: ESTABLISHING A CONNECTION, AND WAITING FOR A COMPLETION
+LLM_CONNECT_TIMEOUT_SEC = float(os.environ.get("LLM_CONNECT_TIMEOUT_SEC", 10))
+LLM_READ_TIMEOUT_SEC = float(os.environ.get("LLM_READ_TIMEOUT_SEC", 300))
+
+# NUMBER OF TOPICS WHOSE MODERATION VERDICT / GENERATED QUESTIONS ARE CACHED (LRU, PERSISTED IN THE DB). 0 DISABLES THE CACHE
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 2000))
+
+# HOW LONG A CACHED MODERATION VERDICT AND CACHED GENERATED QUESTIONS STAY VALID
+MODERATION_CACHE_TTL_SEC = int(os.environ.get("MODERATION_CACHE_TTL_SEC", 30 * 24 * 3600))
+QUESTION_CACHE_TTL_SEC = int(os.environ.get("QUESTION_CACHE_TTL_SEC", 7 * 24 * 3600))
+
+# NUMBER OF GENERATED QUESTIONS KEPT PER TOPIC. ONCE FULL, THEY ARE REUSED IN ROTATION INSTEAD OF CALLING THE LLM
+QUESTION_POOL_SIZE = int(os.environ.get("QUESTION_POOL_SIZE", 3))
+
+# STREAM QUESTION GENERATION AND STOP AS SOON AS THE QUESTION JSON IS COMPLETE OR INVALID, INSTEAD OF WAITING FOR THE WHOLE COMPLETION
+LLM_STREAM_GENERATION = os.environ.get("LLM_STREAM_GENERATION", "false").lower() in ("1", "true", "yes")
+
+# A STREAMED QUESTION LONGER THAN THIS IS CONSIDERED A RUNAWAY GENERATION AND ABORTED
+QUESTION_MAX_CHARS = int(os.environ.get("QUESTION_MAX_CHARS", 2000))
+
+# COMMA SEPARATED COMPLETION SERVERS FOR THE TOPIC SAFETY CHECK AND FOR QUESTION GENERATION
+TOPIC_CHECK_URLS = os.environ.get("TOPIC_CHECK_URLS", "https://mihaidobrescu-trivia-server-1.hf.space/completion").split(",")
+GEN_Q_URLS = os.environ.get("GEN_Q_URLS", "https://mihaidobrescu-trivia-server-2.hf.space/completion").split(",")
+
+# SEND A DUPLICATE REQUEST TO ANOTHER COMPLETION SERVER WHEN ONE TAKES LONGER THAN THE RECENT P95 LATENCY
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+
+# A COMPLETION SERVER IS SKIPPED FOR LLM_BREAKER_COOLDOWN_SEC AFTER LLM_BREAKER_FAILURES FAILED REQUESTS IN A ROW
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 3))
+LLM_BREAKER_COOLDOWN_SEC = float(os.environ.get("LLM_BREAKER_COOLDOWN_SEC", 30))
+
+# LLAMA.CPP SLOT TO PIN THE TOPIC CHECK / QUESTION GENERATION REQUESTS TO, SO THEIR CACHED PROMPT PREFIX STAYS IN THAT SLOT. -1 LETS THE SERVER PICK
+TOPIC_CHECK_SLOT = int(os.environ.get("TOPIC_CHECK_SLOT", -1))
+GEN_Q_SLOT = int(os.environ.get("GEN_Q_SLOT", -1))
+
+# TOPIC SAFETY CHECKS REQUESTED WITHIN THIS WINDOW ARE SENT AS ONE COMPLETION, UP TO MODERATION_BATCH_SIZE TOPICS. A SIZE OF 1 DISABLES BATCHING
+MODERATION_BATCH_WINDOW_MS = int(os.environ.get("MODERATION_BATCH_WINDOW_MS", 100))
+MODERATION_BATCH_SIZE = int(os.environ.get("MODERATION_BATCH_SIZE", 8))
+
+# HOW OFTEN POINT CHANGES KEPT IN MEMORY ARE WRITTEN TO THE DB (THEY ARE ALSO WRITTEN AT THE END OF EVERY ROUND AND JOURNALED RIGHT AWAY)
+POINTS_FLUSH_SEC = float(os.environ.get("POINTS_FLUSH_SEC", 2))
+
+# NUMBER OF PLAYERS WHOSE ID AND POINTS ARE KEPT IN MEMORY (LRU, LOADED FROM THE DB ON DEMAND)
+PLAYER_CACHE_SIZE = int(os.environ.get("PLAYER_CACHE_SIZE", 10000))
+
+# NUMBER OF RENDERED PAGES KEPT IN MEMORY (LRU). THE / PAGE IS CACHED PER LOGGED IN USER AND POINTS
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 1000))
+
+# A DB TRIVIA QUESTION IS NOT SERVED AGAIN WITHIN THIS MANY DB QUESTIONS
+QUESTION_NO_REPEAT = int(os.environ.get("QUESTION_NO_REPEAT", 1000))
+
+# PREBUILT TRIVIA SNAPSHOT (.parquet OR .db) TO SEED A FRESH DB FROM, INSTEAD OF DOWNLOADING THE HF DATASET
+TRIVIA_SNAPSHOT = os.environ.get("TRIVIA_SNAPSHOT", "trivia_snapshot.parquet")
+
+# HOW OFTEN EVERY WORKER PUBLISHES ITS LIST OF ONLINE USERS FOR THE STATS PAGE
+HEARTBEAT_SEC = float(os.environ.get("HEARTBEAT_SEC", 2))
+
+# NUMBER OF CONCURRENT TOPIC EXECUTORS (MODERATION / QUESTION GENERATION) RUN BY THE LEADER
+NUM_EXECUTORS = int(os.environ.get("NUM_EXECUTORS", 2))
+
+# SESSION COOKIE SIGNING KEY. MUST BE THE SAME ON EVERY WORKER/POD; WHEN UNSET, A KEY FILE IS GENERATED
+SESSION_SECRET_KEY = os.environ.get("SESSION_SECRET_KEY")
+
 HF_CLIENT_ID = os.environ.get("HF_CLIENT_ID")
 HF_CLIENT_SECRET = os.environ.get("HF_CLIENT_SECRET")
 HF_REDIRECT_URI = os.environ.get("HF_REDIRECT_URI")
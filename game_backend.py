@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class InProcessBackend:
+    """State and pub/sub for a single worker. Messages are delivered directly and this worker is always the leader.
+
+    Every backend implements the same interface:
+      - `publish(channel, message)` delivers `message` (a JSON-able dict) to every subscriber on every worker
+      - `subscribe(handler)` registers `async handler(channel, message)`
+      - `set_state/get_state/all_state` store JSON-able values that outlive any single worker
+      - `is_leader` tells whether this worker runs the round scheduler and the topic executors;
+        `on_leadership(handler)` registers `async handler(is_leader)` called whenever that changes
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:8]
+        self.handlers = []
+        self.leadership_handlers = []
+        self.state = {}
+        self.is_leader = False
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def on_leadership(self, handler):
+        self.leadership_handlers.append(handler)
+
+    async def start(self):
+        await self._set_leader(True)
+
+    async def stop(self):
+        await self._set_leader(False)
+
+    async def publish(self, channel, message):
+        await self._deliver(channel, message)
+
+    async def set_state(self, key, value):
+        self.state[key] = value
+
+    async def get_state(self, key, default=None):
+        return self.state.get(key, default)
+
+    async def all_state(self):
+        return dict(self.state)
+
+    async def _deliver(self, channel, message):
+        for handler in self.handlers:
+            try:
+                await handler(channel, message)
+            except Exception as e:
+                logging.debug(f"Backend handler failed on {channel}: {e}")
+
+    async def _set_leader(self, is_leader):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        logging.info(f"Worker {self.worker_id} {'is now' if is_leader else 'is no longer'} the leader")
+        for handler in self.leadership_handlers:
+            await handler(is_leader)
+
+
+class SqliteBackend(InProcessBackend):
+    """Shares one logical game between the uvicorn workers (or pods) that can reach the same SQLite file.
+
+    The bus is an append-only table that every worker polls, state is a key/value table and the leader holds a
+    lease that it renews while it's alive. Meant as a local stand-in for a networked store; SQLite must not sit on a
+    network filesystem.
+    """
+
+    def __init__(self, path, poll_interval=0.05, lease_sec=5.0, retention_sec=60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease_sec = lease_sec
+        self.retention_sec = retention_sec
+        self.conn = None
+        self.conn_lock = threading.Lock()
+        self.last_id = 0
+        self.tasks = []
+
+    def _run(self, fn):
+        with self.conn_lock:
+            return fn(self.conn)
+
+    async def _db(self, fn):
+        return await asyncio.to_thread(self._run, fn)
+
+    async def start(self):
+        self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        await self._db(_create_tables)
+        self.last_id = await self._db(lambda c: c.execute("SELECT COALESCE(MAX(id), 0) FROM bus").fetchone()[0])
+        self.tasks = [asyncio.create_task(self._poll_loop()), asyncio.create_task(self._lease_loop())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.is_leader:
+            await self._db(lambda c: c.execute("DELETE FROM leader WHERE name = 'game' AND worker = ?", (self.worker_id,)))
+        await self._set_leader(False)
+        self.conn.close()
+
+    async def publish(self, channel, message):
+        payload = json.dumps(message)
+        await self._db(lambda c: c.execute("INSERT INTO bus (channel, message, created) VALUES (?, ?, ?)", (channel, payload, time.time())))
+
+    async def set_state(self, key, value):
+        payload = json.dumps(value)
+        await self._db(lambda c: c.execute("INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, payload)))
+
+    async def get_state(self, key, default=None):
+        row = await self._db(lambda c: c.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone())
+        return json.loads(row[0]) if row else default
+
+    async def all_state(self):
+        rows = await self._db(lambda c: c.execute("SELECT key, value FROM state").fetchall())
+        return {key: json.loads(value) for key, value in rows}
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                rows = await self._db(lambda c: c.execute("SELECT id, channel, message FROM bus WHERE id > ? ORDER BY id", (self.last_id,)).fetchall())
+                for row_id, channel, message in rows:
+                    self.last_id = row_id
+                    await self._deliver(channel, json.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.debug(f"Bus poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _lease_loop(self):
+        while True:
+            try:
+                now = time.time()
+                holder = await self._db(lambda c: _acquire_lease(c, self.worker_id, now, self.lease_sec))
+                await self._set_leader(holder == self.worker_id)
+                if self.is_leader:
+                    await self._db(lambda c: c.execute("DELETE FROM bus WHERE created < ?", (now - self.retention_sec,)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.debug(f"Leader election failed: {e}")
+                await self._set_leader(False)
+            await asyncio.sleep(self.lease_sec / 3)
+
+
+def _create_tables(conn):
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS bus (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, message TEXT NOT NULL, created REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS leader (name TEXT PRIMARY KEY, worker TEXT NOT NULL, expires REAL NOT NULL)")
+
+
+def _acquire_lease(conn, worker_id, now, lease_sec):
+    "Take or renew the lease if it's free, expired or already ours. Returns the current holder."
+    conn.execute("""INSERT INTO leader (name, worker, expires) VALUES ('game', ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET worker = excluded.worker, expires = excluded.expires
+                    WHERE leader.worker = excluded.worker OR leader.expires < ?""", (worker_id, now + lease_sec, now))
+    return conn.execute("SELECT worker FROM leader WHERE name = 'game'").fetchone()[0]
+
+
+def create_backend(name, db_path):
+    if name == "sqlite":
+        return SqliteBackend(db_path)
+    return InProcessBackend()
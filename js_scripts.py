@@ -109,3 +109,22 @@ def enterToBid():
         });
         """
     return Script(src)
+
+def countdownTicker():
+    src = """
+        (function() {
+            let deadline = null, offset = 0;
+            setInterval(function() {
+                const el = document.getElementById('countdown');
+                if (!el || !el.dataset.deadline) return;
+                if (el.dataset.deadline !== deadline) {
+                    deadline = el.dataset.deadline;
+                    offset = Number(el.dataset.now) - Date.now();
+                }
+                const left = Math.max(0, Math.ceil((Number(deadline) - Date.now() - offset) / 1000));
+                el.textContent = left >= 10 ? left : '0' + left;
+                el.style.color = left <= 5 ? 'red' : '';
+            }, 200);
+        })();
+        """
+    return Script(src)
@@ -0,0 +1,50 @@
+import time
+
+
+class Leaderboard:
+    """Top `k` players by points, kept up to date from the points ledger instead of queried on every page view.
+
+    A change only touches the board when the player is on it or now beats its last entry. When a player on the
+    board loses points, someone off the board might overtake them, so the board is rebuilt from the indexed
+    `players.points` plus the ledger's unflushed balances the next time it's read. `version` changes whenever
+    the board does, so renderings can be cached on it.
+    `refresh_sec` forces a rebuild that often when other workers change points too.
+    """
+
+    def __init__(self, db, ledger, k, refresh_sec=None):
+        self.db = db
+        self.ledger = ledger
+        self.k = k
+        self.refresh_sec = refresh_sec
+        self.points = {}
+        self.ranking = []
+        self.version = 0
+        self.stale = True
+        self.built_at = 0
+        ledger.on_change.append(self.update)
+
+    def update(self, name, points):
+        if name in self.points or len(self.points) < self.k or points > self.ranking[-1][1]:
+            if name in self.points and points < self.points[name]:
+                self.stale = True
+            self.points[name] = points
+            self._rank()
+
+    def _rank(self):
+        ranking = sorted(self.points.items(), key=lambda item: -item[1])[:self.k]
+        self.points = dict(ranking)
+        if ranking != self.ranking:
+            self.ranking = ranking
+            self.version += 1
+
+    async def top(self):
+        "[(name, points)] best first."
+        if self.stale or (self.refresh_sec is not None and time.monotonic() - self.built_at > self.refresh_sec):
+            rows = await self.db.q("SELECT name, points FROM players ORDER BY points DESC LIMIT ?", (self.k,))
+            self.points = {row["name"]: row["points"] for row in rows}
+            for name in self.ledger.unflushed:
+                self.points[name] = self.ledger.balances[name][0]
+            self.stale = False
+            self.built_at = time.monotonic()
+            self._rank()
+        return self.ranking
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+import metrics
+
+
+def normalize(topic):
+    return re.sub(r"\s+", " ", topic).strip().lower()
+
+
+class LLMCache:
+    """LRU cache of LLM results keyed on (kind, normalized topic), written through to a SQLite table.
+
+    Every entry holds a list of values: a moderation verdict is a single value, generated questions are a pool
+    of up to `pool_size` values that are handed out in rotation once the pool is full, so a popular topic
+    doesn't get the same question every time. Concurrent misses for the same key share one LLM call.
+    `ttl_sec` maps every kind to how long its entries stay valid.
+    """
+
+    def __init__(self, max_entries, ttl_sec, pool_size=1):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.pool_size = pool_size
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.db = None
+
+    async def open(self, db):
+        "Persist to the AsyncDB `db` and load what was cached there before, most recent first."
+        self.db = db
+        await db.execute("CREATE TABLE IF NOT EXISTS llm_cache (kind TEXT NOT NULL, topic TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (kind, topic))")
+        rows = await db.q("SELECT kind, topic, value, created FROM llm_cache WHERE created > ? ORDER BY created DESC LIMIT ?",
+                          (time.time() - max(self.ttl_sec.values()), self.max_entries))
+        for row in reversed(rows):
+            if row["created"] > time.time() - self.ttl_sec[row["kind"]]:
+                self.entries[(row["kind"], row["topic"])] = {"values": json.loads(row["value"]), "created": row["created"], "next": 0}
+
+    def close(self):
+        self.db = None
+
+    async def get(self, kind, topic, call):
+        "Return a cached value for `topic`, or `await call(topic)` and cache its result unless it's None or not `cacheable`."
+        if self.max_entries <= 0:
+            return await call(topic)
+        key = (kind, normalize(topic))
+        entry = self.entries.get(key)
+        if entry and entry["created"] < time.time() - self.ttl_sec[kind]:
+            await self._evict(key)
+            entry = None
+        pool_size = self.pool_size if kind == "question" else 1
+        if entry and len(entry["values"]) >= pool_size:
+            self.entries.move_to_end(key)
+            metrics.inc(f"llm_cache_{kind}_hits")
+            value = entry["values"][entry["next"] % len(entry["values"])]
+            entry["next"] += 1
+            return value
+
+        if key in self.in_flight:
+            metrics.inc(f"llm_cache_{kind}_shared")
+        else:
+            metrics.inc(f"llm_cache_{kind}_misses")
+            self.in_flight[key] = [asyncio.create_task(self._fill(key, call, topic)), 0]
+        return await self._wait(key)
+
+    async def _fill(self, key, call, topic):
+        try:
+            value = await call(topic)
+            if value is not None and getattr(value, "cacheable", True):
+                await self._store(key, value)
+            return value
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def _wait(self, key):
+        "Wait for the shared call; it's cancelled only when every caller waiting on it was cancelled."
+        waiting = self.in_flight[key]
+        waiting[1] += 1
+        try:
+            return await asyncio.shield(waiting[0])
+        except asyncio.CancelledError:
+            if waiting[1] == 1:
+                waiting[0].cancel()
+            raise
+        finally:
+            waiting[1] -= 1
+
+    async def _store(self, key, value):
+        entry = self.entries.get(key) or {"values": [], "created": time.time(), "next": 0}
+        entry["values"].append(value)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            await self._evict(next(iter(self.entries)))
+        if self.db is not None:
+            row = (*key, json.dumps(entry["values"]), entry["created"])
+            await self.db.execute("INSERT OR REPLACE INTO llm_cache (kind, topic, value, created) VALUES (?, ?, ?, ?)", row)
+
+    async def _evict(self, key):
+        self.entries.pop(key, None)
+        if self.db is not None:
+            await self.db.execute("DELETE FROM llm_cache WHERE kind = ? AND topic = ?", key)
@@ -1,8 +1,19 @@
 import json
 import httpx
 import logging
+import time
+import env_vars
+import metrics
+from llm_cache import LLMCache
+from endpoint_pool import EndpointPool
+from batcher import Batcher
 
-timeout = httpx.Timeout(300.0)
+# Generation can take minutes on a cold server, but a server that doesn't accept the connection quickly is down.
+timeout = httpx.Timeout(env_vars.LLM_READ_TIMEOUT_SEC, connect=env_vars.LLM_CONNECT_TIMEOUT_SEC)
+client = None
+cache = LLMCache(env_vars.LLM_CACHE_SIZE,
+                 {"verdict": env_vars.MODERATION_CACHE_TTL_SEC, "question": env_vars.QUESTION_CACHE_TTL_SEC},
+                 env_vars.QUESTION_POOL_SIZE)
 
 QUESTION_JSON_SCHEMA = {
   "type": "object",
@@ -36,12 +47,9 @@ QUESTION_JSON_SCHEMA = {
   "required": ["trivia question", "option A", "option B", "option C", "option D", "correct answer"]
 }
 
-def _question_check_prompt(raw_prompt):
-  return f"""You are a policy expert trying to help determine whether a user prompt is in violation of the defined safety policies.
-
-<start_of_turn>
-Human Question: {raw_prompt}
-<end_of_turn>
+# The static policy text comes first and the topic last, so every check shares the same prompt prefix and the
+# server can reuse its KV cache for it instead of evaluating the whole prompt again.
+QUESTION_CHECK_POLICIES = """You are a policy expert trying to help determine whether a user prompt is in violation of the defined safety policies.
 
 Our safety principles are defined in the below:
 
@@ -52,7 +60,28 @@ Our safety principles are defined in the below:
 * "No Sexually Explicit Information": The prompt shall not contain or seek generation of content that contains references to sexual acts or other lewd content (e.g., sexually graphic descriptions, content aimed at causing arousal). Medical or scientific terms related to human anatomy or sex education are permitted.
 ===
 
-Does the human prompt violate at least one of the above principles? Your answer must start with 'Yes' or 'No'. And then walk through step by step to be sure we answer correctly.
+"""
+
+QUESTION_CHECK_PROMPT_PREFIX = QUESTION_CHECK_POLICIES + """Does the human prompt below violate at least one of the above principles? Your answer must start with 'Yes' or 'No'. And then walk through step by step to be sure we answer correctly.
+
+<start_of_turn>
+Human Question: """
+
+def _question_check_prompt(raw_prompt):
+  return f"""{QUESTION_CHECK_PROMPT_PREFIX}{raw_prompt}
+<end_of_turn>
+"""
+
+
+def _batch_check_prompt(raw_prompts):
+  # one JSON string per line, so a topic with newlines or quotes can't pose as another numbered prompt
+  numbered = "\n".join(f"{i}. {json.dumps(' '.join(raw_prompt.split()))}" for i, raw_prompt in enumerate(raw_prompts, 1))
+  return f"""{QUESTION_CHECK_POLICIES}For each numbered human prompt below, given as a quoted string, does it violate at least one of the above principles? Answer 'Yes' or 'No' for every prompt, in the same order, separated by commas.
+
+<start_of_turn>
+Human Questions:
+{numbered}
+<end_of_turn>
 """
 
 
@@ -63,44 +92,212 @@ Follow this JSON schema when providing the answer:
 {QUESTION_JSON_SCHEMA}
 """)
 
-TOPIC_CHECK_URL = "https://mihaidobrescu-trivia-server-1.hf.space/completion"
-GEN_Q_URL =  "https://mihaidobrescu-trivia-server-2.hf.space/completion"
+# Completion servers for each stage; requests are load balanced, hedged and circuit broken across them.
+topic_check_pool = EndpointPool("topic_check", env_vars.TOPIC_CHECK_URLS, env_vars.LLM_BREAKER_FAILURES,
+                                env_vars.LLM_BREAKER_COOLDOWN_SEC, env_vars.LLM_HEDGE)
+generate_question_pool = EndpointPool("generate_question", env_vars.GEN_Q_URLS, env_vars.LLM_BREAKER_FAILURES,
+                                      env_vars.LLM_BREAKER_COOLDOWN_SEC, env_vars.LLM_HEDGE)
 headers = {
     "Content-Type": "application/json"
 }
 
+def start_client():
+    "Create the shared client. Connections to the completion servers are kept alive and reused across calls."
+    global client
+    http2 = env_vars.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logging.warning("LLM_HTTP2 is set but the h2 package is missing, using HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(max_connections=env_vars.LLM_MAX_CONNECTIONS,
+                          max_keepalive_connections=env_vars.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry=env_vars.LLM_KEEPALIVE_EXPIRY_SEC)
+    client = httpx.AsyncClient(headers=headers, limits=limits, timeout=timeout, http2=http2)
+    return client
+
+
+async def close_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+
+def _client():
+    return client if client is not None else start_client()
+
+
 def _add_special_tokens(raw_prompt):
     return f"""<start_of_turn>user\n{raw_prompt}<end_of_turn>\n<start_of_turn>model\n"""
  
 async def topic_check(topic):
+    "Moderation verdict for `topic`, 'Yes' if it breaks the policies and 'No' otherwise. None on errors."
+    return await cache.get("verdict", topic, moderation_batcher.submit if env_vars.MODERATION_BATCH_SIZE > 1 else _topic_check)
+
+
+async def generate_question(topic):
+    "A question for `topic` following QUESTION_JSON_SCHEMA. None on errors."
+    return await cache.get("question", topic, _generate_question)
+
+
+async def _topic_check(topic):
     try:
         data_q_check = {
             "temperature": 0,
             "prompt": _question_check_prompt(topic),
-            "grammar": """root ::= ("Yes" | "No")"""
+            "grammar": """root ::= ("Yes" | "No")""",
+            **_prompt_cache_options(env_vars.TOPIC_CHECK_SLOT)
         }
-        async with httpx.AsyncClient() as client:
-            logging.debug(f"topic_check: {data_q_check}")
-            response = await client.post(TOPIC_CHECK_URL, headers=headers, json=data_q_check, timeout=timeout)
-            logging.debug(response.json())
-            content = response.json()["content"]
-        return content
+        logging.debug(f"topic_check: {data_q_check}")
+        return await topic_check_pool.request(lambda url: _post_completion(url, data_q_check, "topic_check"))
     except:
         return None
 
-async def generate_question(topic):
+
+async def _batch_topic_check(topics):
+    "One completion for several topics, constrained to exactly one Yes/No per topic. None on errors."
     try:
-        data_gen_q = {
-            "n_predict": 2500,
-            "prompt": _add_special_tokens(QUESTION_PROMPT + topic),
-            "json_schema": QUESTION_JSON_SCHEMA
+        verdict_list = ' "," '.join(["verdict"] * len(topics))
+        data_q_check = {
+            "temperature": 0,
+            "prompt": _batch_check_prompt(topics),
+            "grammar": f'root ::= {verdict_list}\nverdict ::= "Yes" | "No"',
+            **_prompt_cache_options(env_vars.TOPIC_CHECK_SLOT)
         }
-        async with httpx.AsyncClient() as client:
-            logging.debug(f"generate_question: {data_gen_q}")
-            response = await client.post(GEN_Q_URL, headers=headers, json=data_gen_q, timeout=timeout)
-            logging.debug(response.json())
-            content = response.json()["content"]
+        logging.debug(f"batch topic_check: {data_q_check}")
+        content = await topic_check_pool.request(lambda url: _post_completion(url, data_q_check, "topic_check"))
+        return [_BatchVerdict(verdict) for verdict in content.split(",")]
+    except:
+        return None
+
+
+class _BatchVerdict(str):
+    "A verdict from a batched check. It's used for this request but not cached, as the other topics may have swayed it."
+    cacheable = False
+
+
+moderation_batcher = Batcher("topic_check", env_vars.MODERATION_BATCH_WINDOW_MS / 1000, env_vars.MODERATION_BATCH_SIZE,
+                             _batch_topic_check, _topic_check)
+
+
+async def _post_completion(url, data, stage):
+    response = await _client().post(url, json=data)
+    response.raise_for_status()
+    logging.debug(response.json())
+    _record_prompt_eval(stage, response.json())
+    return response.json()["content"]
+
+
+def _prompt_cache_options(slot):
+    "Ask llama.cpp to keep the evaluated prompt in the slot's KV cache; -1 lets the server pick the slot with the longest matching prefix."
+    options = {"cache_prompt": True}
+    if slot >= 0:
+        options["id_slot"] = slot
+    return options
+
+
+def _record_prompt_eval(stage, response):
+    "How many prompt tokens the server had to evaluate, i.e. the part of the prompt that wasn't already cached."
+    timings = response.get("timings") or {}
+    if "prompt_n" in timings:
+        metrics.set_gauge(f"{stage}_prompt_eval_tokens", timings["prompt_n"])
+        metrics.inc(f"{stage}_prompt_eval_tokens_total", timings["prompt_n"])
+
+def _question_request(topic):
+    return {
+        "n_predict": 2500,
+        "prompt": _add_special_tokens(QUESTION_PROMPT + topic),
+        "json_schema": QUESTION_JSON_SCHEMA,
+        **_prompt_cache_options(env_vars.GEN_Q_SLOT)
+    }
+
+
+async def _generate_question(topic):
+    if env_vars.LLM_STREAM_GENERATION:
+        return await _generate_question_streaming(topic)
+    try:
+        data_gen_q = _question_request(topic)
+        logging.debug(f"generate_question: {data_gen_q}")
+        content = await generate_question_pool.request(lambda url: _post_completion(url, data_gen_q, "generate_question"))
         return json.loads(content)
     except:
         return None
-    
+
+
+class JsonObjectScanner:
+    "Follows a JSON object as it streams in, to tell when it's complete or can no longer become a valid object."
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.text = ""
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        "Returns 'complete', 'invalid' or None when more text is needed."
+        for char in chunk:
+            self.text += char
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.depth == 0 and not char.isspace() and char != "{":
+                return "invalid"
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return "complete"
+        if len(self.text) > self.max_chars:
+            return "invalid"
+        return None
+
+
+async def _generate_question_streaming(topic):
+    "Stream the completion and stop as soon as the question object is complete or clearly broken."
+    data_gen_q = dict(_question_request(topic), stream=True)
+    try:
+        logging.debug(f"generate_question (streaming): {data_gen_q}")
+        return await generate_question_pool.request(lambda url: _stream_question(url, data_gen_q))
+    except:
+        return None
+
+
+async def _stream_question(url, data_gen_q):
+    scanner = JsonObjectScanner(env_vars.QUESTION_MAX_CHARS)
+    started = time.monotonic()
+    tokens = 0
+    outcome = None
+    async with _client().stream("POST", url, json=data_gen_q) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event.get("stop"):
+                _record_prompt_eval("generate_question", event)
+            if tokens == 0:
+                metrics.set_gauge("generate_question_ttft_sec", round(time.monotonic() - started, 3))
+            tokens += 1
+            outcome = scanner.feed(event.get("content", ""))
+            if outcome or event.get("stop"):
+                break
+    # leaving the block closes the connection, which makes the server stop generating
+    metrics.set_gauge("generate_question_tokens", tokens)
+    if outcome != "complete":
+        logging.debug(f"generate_question aborted ({outcome or 'ended early'}): {scanner.text[:200]}")
+        metrics.inc("generate_question_aborted")
+        return None
+    try:
+        return json.loads(scanner.text)
+    except json.JSONDecodeError:
+        return None
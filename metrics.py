@@ -0,0 +1,30 @@
+from collections import defaultdict
+
+# Process wide counters and gauges, exposed as JSON on /metrics.
+counters = defaultdict(int)
+gauges = {}
+_gauge_fns = {}
+
+
+def inc(name, value=1):
+    counters[name] += value
+
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+
+def register_gauge(name, fn):
+    "Register a callable that is evaluated every time the metrics are read."
+    _gauge_fns[name] = fn
+
+
+def snapshot():
+    values = dict(counters)
+    values.update(gauges)
+    for name, fn in _gauge_fns.items():
+        try:
+            values[name] = fn()
+        except Exception:
+            values[name] = None
+    return values
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from fasthtml.common import Response
+from fasthtml.core import _xt_resp
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Page:
+    "One rendered page with its ETag, compressed on first request per encoding."
+
+    def __init__(self, html):
+        self.body = {"identity": html.encode()}
+        self.etag = '"' + hashlib.blake2b(self.body["identity"], digest_size=12).hexdigest() + '"'
+
+    def encoded(self, encoding):
+        if encoding not in self.body:
+            raw = self.body["identity"]
+            self.body[encoding] = brotli.compress(raw, quality=5) if encoding == "br" else gzip.compress(raw, 6)
+        return self.body[encoding]
+
+
+class PageCache:
+    """Whole HTML pages rendered once per key and served with an ETag, gzip or brotli, and 304 on a conditional GET.
+
+    The key has to cover everything the page depends on; pages built only from config and `VERSION` can use a
+    constant key. Whether it's an htmx request is added to the key, as those get the page without the <head>.
+    At most `size` pages are kept, least recently used first out.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.pages = OrderedDict()
+
+    def render(self, request, *ft):
+        "The full HTML FastHTML would send for handler result `ft`, with the app's headers and footers."
+        return _xt_resp(request, ft).body.decode()
+
+    def get(self, key, build):
+        "The cached page for `key`, built from the HTML string `build()` returns when it isn't cached."
+        page = self.pages.get(key)
+        if page is None:
+            metrics.inc("page_cache_misses")
+            page = self.pages[key] = Page(build())
+            if len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+        else:
+            metrics.inc("page_cache_hits")
+            self.pages.move_to_end(key)
+        return page
+
+    def response(self, request, key, build):
+        "Response for a page built with `build()`, which returns an HTML string, or 304 when the client has it."
+        page = self.get((key, "hx-request" in request.headers), build)
+        headers = {"ETag": page.etag, "Vary": "Accept-Encoding, HX-Request", "Cache-Control": "no-cache"}
+        if page.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        accepted = request.headers.get("accept-encoding", "")
+        encoding = "br" if brotli and "br" in accepted else "gzip" if "gzip" in accepted else "identity"
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(page.encoded(encoding), media_type="text/html", headers=headers)
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+import metrics
+
+
+class PointsLedger:
+    """Player points and combo counts kept in memory and written behind to the `players` table.
+
+    Every change is appended to a journal file, on a thread, before it's applied in memory. A flush applies all pending changes
+    in one transaction, as increments so changes from several workers add up, and records the last applied journal
+    entry in the same transaction. On startup every journal left in the directory is replayed up to that point,
+    so a crash loses nothing and applies nothing twice.
+    `refresh_sec` is how long a cached balance is trusted before it's read again: None when this worker is the
+    only writer, a few seconds when other workers change points too.
+    Players are loaded on demand (login, bid, win) with an indexed lookup by name, and at most `cache_size` of them
+    are kept, least recently used first out. Players with unflushed changes, or in an `adjust` under way, are never evicted.
+    """
+
+    def __init__(self, db, journal_dir, worker_id, refresh_sec=None, cache_size=10000):
+        self.db = db
+        self.journal_dir = journal_dir
+        self.journal_path = os.path.join(journal_dir, f"points-{worker_id}.journal")
+        self.refresh_sec = refresh_sec
+        self.cache_size = cache_size
+        self.balances = OrderedDict()  # name -> [points, loaded at, player id]
+        self.unflushed = {}  # name -> sum of its pending deltas
+        self.pinned = set()  # names of the `adjust` under way
+        self.pending = []
+        self.seq = 0
+        self.combo_counts = {}
+        self.on_change = []  # callbacks(name, points) run whenever a balance changes here
+        self.flush_lock = asyncio.Lock()
+        # entries are appended in seq order and the journal is only emptied when nothing is pending
+        self.journal_lock = asyncio.Lock()
+
+    async def open(self):
+        await self.db.execute("CREATE TABLE IF NOT EXISTS points_journal (journal TEXT PRIMARY KEY, last_seq INTEGER NOT NULL)")
+        for name in os.listdir(self.journal_dir):
+            if name.startswith("points-") and name.endswith(".journal"):
+                await self._replay(os.path.join(self.journal_dir, name))
+
+    async def close(self):
+        await self.flush()
+        if not self.pending:
+            # everything is in the DB, nothing to replay on the next start
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+
+    async def _replay(self, path):
+        # several workers start together and replay the same journals; _apply skips what was applied already
+        try:
+            with open(path) as f:
+                entries = [json.loads(line) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            return
+        applied = await self.db.transaction(_apply, os.path.basename(path), entries)
+        if applied:
+            logging.info(f"Replayed {applied} points changes from {path}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def get(self, name):
+        "Current points of `name`, or None if there's no such player."
+        entry = self.balances.get(name)
+        if entry is None or (self.refresh_sec is not None and time.monotonic() - entry[1] > self.refresh_sec):
+            metrics.inc("player_cache_misses")
+            rows = await self.db.q("SELECT id, points FROM players WHERE name = ?", (name,))
+            if not rows:
+                return None
+            entry = self.balances[name] = [rows[0]["points"] + self.unflushed.get(name, 0), time.monotonic(), rows[0]["id"]]
+            self._evict()
+        else:
+            metrics.inc("player_cache_hits")
+        self.balances.move_to_end(name)
+        return entry[0]
+
+    async def create(self, name, points):
+        "Insert a new player with `points`, unless a concurrent request or another worker just did, and return its points."
+        await self.db.execute("INSERT INTO players (name, points) VALUES (?, ?) ON CONFLICT(name) DO NOTHING", (name, points))
+        self.balances.pop(name, None)
+        points = await self.get(name)
+        self._changed(name)
+        return points
+
+    def _evict(self):
+        excess = len(self.balances) - self.cache_size
+        if excess > 0:
+            # the oldest `excess` players that have nothing waiting to be flushed
+            oldest = itertools.islice(self.balances, excess + len(self.unflushed) + len(self.pinned))
+            for name in [name for name in oldest if name not in self.unflushed and name not in self.pinned][:excess]:
+                del self.balances[name]
+        metrics.set_gauge("player_cache_size", len(self.balances))
+
+    async def adjust(self, changes):
+        "Apply a list of (name, delta) and return the new balances. One journal write for the whole list."
+        if not changes:
+            return []
+        async with self.journal_lock:
+            # loading one player can evict another; none of this batch may go before its delta is applied
+            self.pinned = set(name for name, _ in changes)
+            try:
+                for name in self.pinned:
+                    await self.get(name)
+                entries = []
+                for name, delta in changes:
+                    self.seq += 1
+                    entries.append((self.seq, name, delta))
+                await asyncio.to_thread(_append, self.journal_path, entries)
+                self.pending.extend(entries)
+                for _, name, delta in entries:
+                    self.balances[name][0] += delta
+                    self.unflushed[name] = self.unflushed.get(name, 0) + delta
+            finally:
+                self.pinned = set()
+        self._evict()
+        for name in dict.fromkeys(name for name, _ in changes):
+            self._changed(name)
+        metrics.set_gauge("points_pending_changes", len(self.pending))
+        return [self.balances[name][0] for name, _ in changes]
+
+    def _changed(self, name):
+        for callback in self.on_change:
+            callback(name, self.balances[name][0])
+
+    async def flush(self):
+        "Write every pending change to the players table in one transaction."
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            entries, self.pending = self.pending, []
+            started = time.monotonic()
+            try:
+                await self.db.transaction(_apply, os.path.basename(self.journal_path), entries)
+            except Exception as e:
+                logging.warning(f"Points flush failed, will retry: {e}")
+                self.pending = entries + self.pending
+                return
+            self.unflushed = {}
+            for _, name, delta in self.pending:
+                self.unflushed[name] = self.unflushed.get(name, 0) + delta
+            async with self.journal_lock:
+                if not self.pending:
+                    # everything in the journal is in the DB now
+                    await asyncio.to_thread(_truncate, self.journal_path)
+            metrics.inc("points_flushes")
+            metrics.set_gauge("points_flush_sec", round(time.monotonic() - started, 4))
+            metrics.set_gauge("points_pending_changes", len(self.pending))
+
+    async def run_flusher(self, interval_sec):
+        while True:
+            await asyncio.sleep(interval_sec)
+            await self.flush()
+
+
+def _append(path, entries):
+    with open(path, "a") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _truncate(path):
+    open(path, "w").close()
+
+
+def _apply(conn, journal, entries):
+    "Apply the journal entries newer than the last one applied from `journal`. Runs in one transaction. Returns how many."
+    row = conn.execute("SELECT last_seq FROM points_journal WHERE journal = ?", (journal,)).fetchone()
+    last_seq = row[0] if row else 0
+    totals = {}
+    for seq, name, delta in entries:
+        if seq > last_seq:
+            totals[name] = totals.get(name, 0) + delta
+    conn.executemany("UPDATE players SET points = points + ? WHERE name = ?", [(delta, name) for name, delta in totals.items()])
+    new_last_seq = max([last_seq] + [seq for seq, _, _ in entries])
+    conn.execute("INSERT INTO points_journal (journal, last_seq) VALUES (?, ?) ON CONFLICT(journal) DO UPDATE SET last_seq = excluded.last_seq",
+                 (journal, new_last_seq))
+    return sum(1 for seq, _, _ in entries if seq > last_seq)
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import random
+from collections import deque
+
+
+class QuestionDeck:
+    """Deals DB trivia questions from a shuffled permutation of the trivias ids, walked in order.
+
+    Only the ids are kept in memory; the rows are loaded when they're dealt. When the deck runs out it's reloaded
+    (picking up newly imported questions) and reshuffled, and the last `no_repeat` ids dealt are moved to the back
+    so nothing comes back within that many questions.
+    """
+
+    def __init__(self, db, no_repeat):
+        self.db = db
+        self.no_repeat = no_repeat
+        self.ids = []
+        self.position = 0
+        self.recent = deque(maxlen=no_repeat)
+
+    async def _shuffle(self):
+        ids = await self.db.run(lambda c: [row[0] for row in c.execute("SELECT id FROM trivias")])
+        await asyncio.to_thread(random.shuffle, ids)  # a few tens of ms for 100k questions, kept off the event loop
+        recent = set(self.recent)
+        if len(recent) < len(ids):
+            known = set(ids)
+            ids = [i for i in ids if i not in recent] + [i for i in self.recent if i in known]
+        self.ids = ids
+        self.position = 0
+        logging.debug(f"Question deck shuffled: {len(ids)} questions")
+
+    async def deal(self, n):
+        "The next `n` questions as trivias rows, fewer if the table doesn't have that many."
+        dealt = []
+        for _ in range(2):
+            if self.position >= len(self.ids):
+                await self._shuffle()
+            taken = self.ids[self.position:self.position + n - len(dealt)]
+            self.position += len(taken)
+            dealt += taken
+            if len(dealt) == n:
+                break
+        if not dealt:
+            return []
+        self.recent.extend(dealt)
+        placeholders = ", ".join("?" * len(dealt))
+        rows = {row["id"]: row for row in await self.db.q(f"SELECT * FROM trivias WHERE id IN ({placeholders})", dealt)}
+        return [rows[i] for i in dealt if i in rows]
@@ -0,0 +1,66 @@
+import asyncio
+from fasthtml.common import Div
+from broadcast import render
+
+STATUS_COLORS = {
+    'failed': '#dc552c',
+    'pending': '#ede7dd',
+    'computing': '#cfb767',
+    'successful': '#77ab59'
+}
+
+
+def render_card(slot, topic):
+    if topic is None:
+        return Div(id=f"topic_card_{slot}")
+    return Div(Div(f"{topic.topic if topic.status not in ['pending', 'failed'] else 'Topic Censored'}"),
+               Div(topic.user, cls="item left"), Div(f"{topic.points} pts", cls="item right"),
+               cls="card", style=f"background-color: {STATUS_COLORS[topic.status]}", id=f"topic_card_{slot}")
+
+
+class TopicBoard:
+    """Versioned model of the #next_topics board.
+
+    Every card lives in a fixed slot with its own id. Changes made within `window` seconds are merged into one
+    flush, and a flush only sends the slots whose html changed, as out of band swaps. Changes that come in while a
+    flush is sending get a flush of their own right after it.
+    """
+
+    def __init__(self, get_topics, nr_slots, window, send):
+        self.get_topics = get_topics
+        self.nr_slots = nr_slots
+        self.window = window
+        self.send = send
+        self.cards = [render(render_card(slot, None)) for slot in range(nr_slots)]
+        self.version = 0
+        self.flush_task = None
+        self.dirty = False
+
+    def snapshot(self):
+        "The whole board as of the last flush; later flushes are deltas on top of it."
+        return "".join(['<div id="next_topics">', *self.cards, '</div>'])
+
+    def changed(self):
+        self.dirty = True
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        while self.dirty:
+            self.dirty = False
+            await self.flush()
+
+    async def flush(self):
+        topics = list(self.get_topics())[:self.nr_slots]
+        topics += [None] * (self.nr_slots - len(topics))
+        changed = []
+        for slot, topic in enumerate(topics):
+            card = render(render_card(slot, topic))
+            if card != self.cards[slot]:
+                self.cards[slot] = card
+                changed.append(card)
+        if changed:
+            self.version += 1
+            await self.send("".join(changed))
+        return len(changed)
@@ -0,0 +1,77 @@
+import heapq
+import itertools
+from collections import defaultdict
+
+
+class TopicStore:
+    """Topics ordered by bid: points desc, FIFO for ties.
+
+    Keeps a heap of every topic, a heap of successful topics and a set per status, so inserts and
+    popping the highest successful topic are O(log n) and "is anything still pending?" is O(1).
+    Removed topics and status changes are left in the heaps and skipped lazily.
+    """
+
+    def __init__(self):
+        self.seq = itertools.count()
+        self.keys = {}
+        self.heap = []
+        self.successful_heap = []
+        self.by_status = defaultdict(dict)
+
+    def add(self, topic):
+        key = (-topic.points, next(self.seq), topic)
+        self.keys[id(topic)] = key
+        self.by_status[topic.status][id(topic)] = topic
+        heapq.heappush(self.heap, key)
+        if topic.status == "successful":
+            heapq.heappush(self.successful_heap, key)
+
+    def remove(self, topic):
+        if self.keys.pop(id(topic), None) is not None:
+            self.by_status[topic.status].pop(id(topic), None)
+        if len(self.heap) > 2 * len(self.keys) + 32:
+            self.heap = [k for k in self.heap if self.keys.get(id(k[2])) is k]
+            heapq.heapify(self.heap)
+
+    def set_status(self, topic, status):
+        if id(topic) not in self.keys:
+            topic.status = status
+            return
+        self.by_status[topic.status].pop(id(topic), None)
+        topic.status = status
+        self.by_status[status][id(topic)] = topic
+        if status == "successful":
+            heapq.heappush(self.successful_heap, self.keys[id(topic)])
+
+    def pop_successful(self):
+        "Remove and return the highest bid successful topic, or None."
+        while self.successful_heap:
+            key = heapq.heappop(self.successful_heap)
+            topic = key[2]
+            if self.keys.get(id(topic)) is key and topic.status == "successful":
+                self.remove(topic)
+                return topic
+        return None
+
+    def any_pending(self):
+        "True while some topic still waits for moderation or generation."
+        return bool(self.by_status["pending"]) or bool(self.by_status["computing"])
+
+    def with_status(self, status):
+        "Topics with `status`, highest bid first."
+        return [k[2] for k in sorted(self.keys[i] for i in self.by_status[status])]
+
+    def count(self, status):
+        return len(self.by_status[status])
+
+    def top(self, n):
+        return [k[2] for k in heapq.nsmallest(n, (k for k in self.heap if self.keys.get(id(k[2])) is k))]
+
+    def __contains__(self, topic):
+        return id(topic) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter([k[2] for k in sorted(self.keys.values())])
@@ -0,0 +1,110 @@
+"""Loads the trivia questions into the `trivias` table.
+
+At startup the table is created empty and the import runs in the background, so the app serves right away with
+whatever is loaded so far. Rows come from a prebuilt snapshot when there is one (`TRIVIA_SNAPSHOT`, a .parquet
+or .db file), otherwise from the Hugging Face dataset, and are inserted with executemany in chunks.
+
+Build a snapshot to bundle with the image:
+
+    python trivia_import.py trivia_snapshot.parquet
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import time
+import metrics
+
+DATASET = 'Mihaiii/trivia_single_choice-4-options'
+COLUMNS = ["topic", "question", "option_A", "option_B", "option_C", "option_D", "correct_option"]
+CHUNK_ROWS = 5000
+# An import that hasn't shown progress for this long is considered dead and is started over by the next worker.
+STALE_SEC = 60
+
+CREATE_TRIVIAS = '''
+CREATE TABLE IF NOT EXISTS trivias (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    question TEXT NOT NULL,
+    option_A TEXT NOT NULL,
+    option_B TEXT NOT NULL,
+    option_C TEXT NOT NULL,
+    option_D TEXT NOT NULL,
+    correct_option TEXT NOT NULL
+);
+'''
+
+
+def claim_import(conn):
+    "Create the tables and return True if this worker should run the import. Legacy DBs that already have rows count as imported."
+    conn.execute(CREATE_TRIVIAS)
+    conn.execute("CREATE TABLE IF NOT EXISTS trivia_import (id INTEGER PRIMARY KEY CHECK (id = 1), status TEXT NOT NULL, heartbeat REAL NOT NULL)")
+    state = conn.execute("SELECT status, heartbeat FROM trivia_import").fetchone()
+    if state is None and conn.execute("SELECT EXISTS (SELECT 1 FROM trivias)").fetchone()[0]:
+        state = ("done", time.time())
+        conn.execute("INSERT INTO trivia_import (id, status, heartbeat) VALUES (1, 'done', ?)", (state[1],))
+    if state is not None and (state[0] == "done" or time.time() - state[1] < STALE_SEC):
+        return False
+    # nobody imported yet, or an import died half way: start over
+    conn.execute("DELETE FROM trivias")
+    conn.execute("INSERT OR REPLACE INTO trivia_import (id, status, heartbeat) VALUES (1, 'importing', ?)", (time.time(),))
+    return True
+
+
+def load_rows(snapshot_path):
+    "Every question as a tuple in COLUMNS order, from the snapshot if there is one, else from the HF dataset."
+    if snapshot_path and os.path.exists(snapshot_path):
+        logging.info(f"Importing trivia from snapshot {snapshot_path}")
+        if snapshot_path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            table = pq.read_table(snapshot_path, columns=COLUMNS)
+            return list(zip(*[table.column(c).to_pylist() for c in COLUMNS]))
+        with sqlite3.connect(snapshot_path) as snapshot:
+            return snapshot.execute(f"SELECT {', '.join(COLUMNS)} FROM trivias ORDER BY id").fetchall()
+    logging.info(f"Importing trivia from the {DATASET} dataset")
+    from datasets import load_dataset
+    dataset = load_dataset(DATASET, split='train')
+    return list(zip(*[dataset[c] for c in COLUMNS]))
+
+
+async def import_trivias(db, snapshot_path, on_progress=None):
+    "Runs the import if no worker did it yet. `on_progress()` is called after every chunk, once those questions can be dealt."
+    if not await db.transaction(claim_import):
+        return
+    started = time.monotonic()
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(STALE_SEC / 6)
+            await db.execute("UPDATE trivia_import SET heartbeat = ?", (time.time(),))
+
+    beating = asyncio.create_task(heartbeat())
+    try:
+        rows = await asyncio.to_thread(load_rows, snapshot_path)
+        insert = f"INSERT INTO trivias ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        for i in range(0, len(rows), CHUNK_ROWS):
+            await db.transaction(lambda c, chunk: c.executemany(insert, chunk), rows[i:i + CHUNK_ROWS])
+            metrics.set_gauge("trivia_rows_imported", min(i + CHUNK_ROWS, len(rows)))
+            if on_progress:
+                on_progress()
+        # secondary indexes would be created here, after the bulk load; trivias is only read by primary key
+        await db.execute("UPDATE trivia_import SET status = 'done', heartbeat = ?", (time.time(),))
+        logging.info(f"Imported {len(rows)} trivia questions in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logging.warning(f"Trivia import failed: {e}")
+    finally:
+        beating.cancel()
+
+
+def build_snapshot(path):
+    "Write the HF dataset to a parquet snapshot that can be bundled with the image."
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    rows = load_rows(None)
+    pq.write_table(pa.table({c: [row[i] for row in rows] for i, c in enumerate(COLUMNS)}), path)
+    print(f"Wrote {len(rows)} questions to {path}")
+
+
+if __name__ == "__main__":
+    build_snapshot(sys.argv[1])